@@ -0,0 +1,111 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import os
+import sys
+import time
+import importlib
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ("user_service", "order_service")
+
+# Benchmarks import `shared` the same way the services do
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_loaded: Dict[str, dict] = {}
+
+
+def _service_of(module) -> str:
+    path = getattr(module, "__file__", None) or ""
+    for service in SERVICES:
+        if os.path.dirname(os.path.abspath(path)) == os.path.join(ROOT, service):
+            return service
+    return ""
+
+
+def load_service(service: str, module: str = "main"):
+    """
+    Import a module from a service directory.
+    Both services use the same top-level module names (config, database, main),
+    so the modules of the other service are stashed away while importing.
+    """
+    for name, mod in list(sys.modules.items()):
+        owner = _service_of(mod)
+        if owner:
+            _loaded.setdefault(owner, {})[name] = sys.modules.pop(name)
+    sys.modules.update(_loaded.get(service, {}))
+
+    service_dir = os.path.join(ROOT, service)
+    sys.path.insert(0, service_dir)
+    try:
+        return importlib.import_module(module)
+    finally:
+        sys.path.remove(service_dir)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def asgi_client(app, base_url: str = "http://testserver"):
+    """httpx client that calls an ASGI app in-process"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base_url)
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+class Stack:
+    """Both services running in-process, with clients to call them"""
+
+    def __init__(self, user_service, order_service, user_client, order_client):
+        self.user_service = user_service
+        self.order_service = order_service
+        self.user_client = user_client
+        self.order_client = order_client
+
+    async def create_user(self, email: str, password: str = "password") -> Dict[str, str]:
+        """Create a user, log in and return the Authorization header"""
+        await self.user_client.post(
+            "/users/createUser",
+            json={"email": email, "full_name": "Bench User", "password": password}
+        )
+        response = await self.user_client.post("/token", data={"username": email, "password": password})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@asynccontextmanager
+async def service_stack(mongo_factory):
+    """
+    Start both services in-process on the Mongo stand-in built by `mongo_factory(url)`.
+    The Order Service reaches the User Service through an in-process ASGI transport.
+    """
+    user_main = load_service("user_service")
+    user_main.db.client_factory = mongo_factory
+    order_main = load_service("order_service")
+    order_main.db.client_factory = mongo_factory
+    user_client_module = load_service("order_service", "user_service")
+
+    async with user_main.app.router.lifespan_context(user_main.app):
+        async with order_main.app.router.lifespan_context(order_main.app):
+            # Rewire the pooled User Service client to the in-process app
+            await user_client_module.close_client()
+            await user_client_module.start_client(transport=httpx.ASGITransport(app=user_main.app))
+            async with asgi_client(user_main.app) as user_client, asgi_client(order_main.app) as order_client:
+                yield Stack(user_main, order_main, user_client, order_client)
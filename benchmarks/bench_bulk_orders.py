@@ -0,0 +1,58 @@
+"""
+Order creation throughput: single-order endpoint vs bulk endpoint.
+
+Runs the Order Service in-process with local token verification and the
+in-memory Mongo stand-in, with a simulated per-operation round trip.
+
+    python benchmarks/bench_bulk_orders.py --orders 5000 --latency 0.0005
+"""
+import argparse
+import asyncio
+import os
+
+from jose import jwt
+
+from _harness import Timer, asgi_client, load_service
+from memory_mongo import MemoryClient
+
+ORDER = {
+    "items": [{"product_id": "sku-1", "quantity": 2, "price_per_unit": 9.99}],
+    "shipping_address": "123 Main St",
+}
+
+
+async def main(args):
+    os.environ["AUTH_MODE"] = "local"
+    service = load_service("order_service")
+    service.db.client_factory = lambda url, **kwargs: MemoryClient(url, latency=args.latency)
+
+    token = jwt.encode(
+        {"sub": "bench@example.com", "user_id": "64b7f0c2a1b2c3d4e5f60718"},
+        service.settings.jwt_secret_key,
+        algorithm=service.settings.jwt_algorithm
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with service.app.router.lifespan_context(service.app):
+        async with asgi_client(service.app) as client:
+            print(f"orders={args.orders} simulated round trip={args.latency * 1000:.2f} ms")
+
+            with Timer() as timer:
+                for _ in range(args.orders):
+                    await client.post("/orders/createOrder", json=ORDER, headers=headers)
+            print(f"{'single':>12s}: {args.orders / timer.elapsed:10.1f} orders/s")
+
+            for batch_size in args.batch_sizes:
+                with Timer() as timer:
+                    for start in range(0, args.orders, batch_size):
+                        batch = [ORDER] * min(batch_size, args.orders - start)
+                        await client.post("/orders/createOrders", json=batch, headers=headers)
+                print(f"{f'batch {batch_size}':>12s}: {args.orders / timer.elapsed:10.1f} orders/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0005)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+createOrder throughput and latency with and without group commit.
+
+Runs the Order Service in-process with local token verification and the
+in-memory Mongo stand-in. Both paths use the same client, hence the same
+write concern; only ORDER_INSERT_BATCHING differs.
+
+    python benchmarks/bench_group_commit.py --orders 5000 --concurrency 500 --latency 0.001
+"""
+import argparse
+import asyncio
+import os
+
+from jose import jwt
+
+from _harness import Timer, asgi_client, load_service, percentile
+from memory_mongo import MemoryClient
+
+ORDER = {
+    "items": [{"product_id": "sku-1", "quantity": 2, "price_per_unit": 9.99}],
+    "shipping_address": "123 Main St",
+}
+
+
+async def run(client, headers, total: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            with Timer() as timer:
+                response = await client.post("/orders/createOrder", json=ORDER, headers=headers)
+            if response.status_code != 201:
+                raise RuntimeError(f"createOrder -> {response.status_code}: {response.text}")
+            latencies.append(timer.elapsed)
+
+    with Timer() as timer:
+        await asyncio.gather(*(one() for _ in range(total)))
+    return total / timer.elapsed, latencies
+
+
+async def main(args):
+    os.environ["AUTH_MODE"] = "local"
+    service = load_service("order_service")
+    mongo = MemoryClient("memory://", latency=args.latency)
+    service.db.client_factory = lambda url, **kwargs: mongo
+    service.settings.order_insert_batch_delay_ms = args.delay_ms
+    service.settings.order_insert_batch_max = args.max_batch
+
+    token = jwt.encode(
+        {"sub": "bench@example.com", "user_id": "64b7f0c2a1b2c3d4e5f60718"},
+        service.settings.jwt_secret_key,
+        algorithm=service.settings.jwt_algorithm
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with service.app.router.lifespan_context(service.app):
+        async with asgi_client(service.app) as client:
+            print(
+                f"orders={args.orders} concurrency={args.concurrency} "
+                f"simulated round trip={args.latency * 1000:.2f} ms "
+                f"batch delay={args.delay_ms} ms max batch={args.max_batch}"
+            )
+            for batching in (False, True):
+                service.settings.order_insert_batching = batching
+                await run(client, headers, min(200, args.orders), args.concurrency)
+                ops_before = mongo.ops[("orders", "insert")]
+                throughput, latencies = await run(client, headers, args.orders, args.concurrency)
+                inserts = mongo.ops[("orders", "insert")] - ops_before
+                print(
+                    f"{'group commit' if batching else 'insert_one':>12s}: {throughput:10.1f} orders/s  "
+                    f"p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+                    f"p99 {percentile(latencies, 99) * 1000:7.2f} ms  "
+                    f"{inserts} insert round trips"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.001)
+    parser.add_argument("--delay-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
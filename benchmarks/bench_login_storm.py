@@ -0,0 +1,69 @@
+"""
+/users/me latency while logins run concurrently.
+
+Runs the User Service in-process against the in-memory Mongo stand-in and
+measures /users/me p50/p99 while a pool of clients keeps logging in, first
+with bcrypt inline on the event loop (workers=0) and then on the worker pool.
+
+    python benchmarks/bench_login_storm.py --logins 8 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from _harness import asgi_client, load_service, percentile
+from memory_mongo import MemoryClient
+
+
+async def measure(client, headers, credentials, args) -> list:
+    stop = asyncio.Event()
+
+    async def login_loop():
+        while not stop.is_set():
+            await client.post("/token", data=credentials)
+
+    storm = [asyncio.create_task(login_loop()) for _ in range(args.logins)]
+    latencies = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        await client.get("/users/me", headers=headers)
+        latencies.append(time.perf_counter() - start)
+    stop.set()
+    await asyncio.gather(*storm)
+    return latencies
+
+
+async def main(args):
+    service = load_service("user_service")
+    passwords = load_service("user_service", "passwords")
+    service.db.client_factory = MemoryClient
+    workers = args.workers or os.cpu_count() or 4
+
+    async with service.app.router.lifespan_context(service.app):
+        async with asgi_client(service.app) as client:
+            user = {"email": "bench@example.com", "full_name": "Bench User", "password": "password"}
+            await client.post("/users/createUser", json=user)
+            credentials = {"username": user["email"], "password": user["password"]}
+            token = (await client.post("/token", data=credentials)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            print(f"concurrent logins={args.logins} /users/me requests={args.requests}")
+            for label, pool_size in (("inline bcrypt", 0), (f"pool ({workers} workers)", workers)):
+                passwords.hasher.shutdown()
+                passwords.hasher = passwords.PasswordHasher(pool_size, max_queue=10_000)
+                passwords.hasher.start()
+                latencies = await measure(client, headers, credentials, args)
+                print(
+                    f"{label:22s} p50={percentile(latencies, 50) * 1000:8.2f} ms "
+                    f"p99={percentile(latencies, 99) * 1000:8.2f} ms"
+                )
+            passwords.hasher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
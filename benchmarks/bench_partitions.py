@@ -0,0 +1,108 @@
+"""
+Order write throughput as the orders are partitioned over more databases.
+
+Runs the Order Service in-process with local token verification, creating
+orders for many users concurrently, once per partition count. By default each
+partition is an in-memory stand-in serving at most `--write-slots` writes at a
+time with a simulated round trip, i.e. a server at its write ceiling;
+`--mongodb-urls` uses local mongod processes instead (one per URL, the
+partition counts going up to the number of URLs).
+
+    python benchmarks/bench_partitions.py --partitions 1 2 4 8 --orders 4000
+    python benchmarks/bench_partitions.py --mongodb-urls mongodb://localhost:27017 mongodb://localhost:27018
+"""
+import argparse
+import asyncio
+import os
+from collections import Counter
+
+from bson import ObjectId
+from jose import jwt
+
+from _harness import Timer, asgi_client, load_service, percentile
+from memory_mongo import MemoryClient
+
+ORDER = {
+    "items": [{"product_id": "sku-1", "quantity": 1, "price_per_unit": 4.5}],
+    "shipping_address": "7 Partition Row",
+}
+
+
+async def run(client, users, orders: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], Counter()
+
+    async def one(i):
+        async with semaphore:
+            with Timer() as timer:
+                response = await client.post("/orders/createOrder", json=ORDER, headers=users[i % len(users)])
+            latencies.append(timer.elapsed)
+            statuses[response.status_code] += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*(one(i) for i in range(orders)))
+    return orders / timer.elapsed, latencies, statuses
+
+
+async def main(args):
+    os.environ["AUTH_MODE"] = "local"
+    service = load_service("order_service")
+    database = load_service("order_service", "database")
+
+    users = [
+        {"Authorization": "Bearer " + jwt.encode(
+            {"sub": f"user{i}@example.com", "user_id": str(ObjectId())},
+            service.settings.jwt_secret_key,
+            algorithm=service.settings.jwt_algorithm
+        )}
+        for i in range(args.users)
+    ]
+    counts = range(1, len(args.mongodb_urls) + 1) if args.mongodb_urls else args.partitions
+    print(
+        f"orders={args.orders} users={args.users} concurrency={args.concurrency} "
+        + (f"mongod processes={len(args.mongodb_urls)}" if args.mongodb_urls else
+           f"simulated round trip={args.latency * 1000:.2f} ms write slots per partition={args.write_slots}")
+    )
+
+    for count in counts:
+        if args.mongodb_urls:
+            targets = [(url, f"bench_partitions_{i}") for i, url in enumerate(args.mongodb_urls[:count])]
+        else:
+            targets = [(f"memory://partition{i}", f"orders_{i}") for i in range(count)]
+        service.db.partitions[:] = [database.Database(url, name) for url, name in targets]
+        service.db.routes.clear()
+        if not args.mongodb_urls:
+            clients = {}
+            service.db.client_factory = lambda url, **kwargs: clients.setdefault(
+                url, MemoryClient(url, latency=args.latency, write_slots=args.write_slots)
+            )
+
+        async with service.app.router.lifespan_context(service.app):
+            async with asgi_client(service.app) as client:
+                await run(client, users, min(200, args.orders), args.concurrency)
+                throughput, latencies, statuses = await run(client, users, args.orders, args.concurrency)
+                spread = []
+                for partition in service.db.partitions:
+                    spread.append(await (await partition.get_database()).orders.count_documents({}))
+                if args.mongodb_urls:
+                    for partition in service.db.partitions:
+                        await partition.client.drop_database(partition.database_name)
+        errors = sum(n for status, n in statuses.items() if status != 201)
+        print(
+            f"{count:3d} partition(s): {throughput:10.1f} orders/s  "
+            f"p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:7.2f} ms  "
+            f"orders per partition {spread}" + (f"  errors {errors}" if errors else "")
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=4000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated write round trip in seconds")
+    parser.add_argument("--write-slots", type=int, default=4, help="concurrent writes each stand-in serves")
+    parser.add_argument("--mongodb-urls", nargs="+", help="one local mongod per partition instead of stand-ins")
+    asyncio.run(main(parser.parse_args()))
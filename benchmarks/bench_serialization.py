@@ -0,0 +1,78 @@
+"""
+Serialization cost per order: response_model path vs FastJSONResponse path.
+
+The response_model path mirrors what FastAPI does for a handler returning
+OrderResponse objects: build the models, dump them, validate again against
+the response field, serialize to JSON-compatible data and json.dumps it.
+
+    python benchmarks/bench_serialization.py --sizes 10 1000 100000
+"""
+import argparse
+import json
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from _harness import Timer  # also puts the repository root on sys.path
+from shared.models.order import OrderResponse, OrderStatus
+from shared.utils.responses import dumps, orjson, serialize_document
+
+
+def make_orders(count: int) -> List[dict]:
+    now = datetime.now()
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": "64b7f0c2a1b2c3d4e5f60718",
+            "items": [
+                {"product_id": f"sku-{i}", "quantity": 2, "price_per_unit": 9.99},
+                {"product_id": f"sku-{i + 1}", "quantity": 1, "price_per_unit": 24.5},
+            ],
+            "shipping_address": "123 Main St",
+            "status": OrderStatus.PENDING,
+            "total_amount": 44.48,
+            "created_at": now,
+            "updated_at": now,
+            "version": 1,
+        }
+        for i in range(count)
+    ]
+
+
+adapter = TypeAdapter(List[OrderResponse])
+
+
+def response_model_path(orders: List[dict]) -> bytes:
+    models = []
+    for order in orders:
+        order = dict(order)
+        order["id"] = str(order.pop("_id"))
+        models.append(OrderResponse(**order))
+    validated = adapter.validate_python([model.model_dump() for model in models])
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+
+def fast_path(orders: List[dict]) -> bytes:
+    return dumps([serialize_document(order, OrderResponse) for order in orders])
+
+
+def main(args):
+    print(f"encoder: {'orjson' if orjson else 'json (orjson not installed)'}")
+    for size in args.sizes:
+        orders = make_orders(size)
+        repeats = max(1, args.budget // size)
+        for label, serialize in (("response_model", response_model_path), ("fast", fast_path)):
+            with Timer() as timer:
+                for _ in range(repeats):
+                    serialize(orders)
+            per_order = timer.elapsed / (repeats * size) * 1e6
+            print(f"size={size:>7d} {label:>15s}: {per_order:8.2f} us/order")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--budget", type=int, default=200000, help="orders serialized per measurement")
+    main(parser.parse_args())
@@ -0,0 +1,204 @@
+"""
+Cold-start profile of both services, tracked against a baseline.
+
+Each run starts a fresh interpreter per service that imports the service,
+runs its lifespan on the in-memory Mongo stand-in and sends the first real
+requests (create user + login, or create order with local token
+verification). Reported, as medians over the runs:
+
+- imports: importing main (FastAPI, Motor, passlib, jose, httpx, models...)
+  and the benchmark helpers
+- ready: imports plus lifespan startup, i.e. when readiness is reported
+- first request / second request: latency of the first and of the next request
+
+One extra run with `python -X importtime` breaks the import time down by
+top-level package (time spent in the package's own modules). Results are
+compared against a stored baseline, like suite.py:
+
+    python benchmarks/bench_startup.py --update-baseline
+    python benchmarks/bench_startup.py --fail-on-regression 20
+    STARTUP_WARMUP=false python benchmarks/bench_startup.py    # without the lifespan warm-up
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+METRICS = ("imports_ms", "ready_ms", "first_request_ms", "second_request_ms")
+ORDER = {
+    "items": [{"product_id": "sku-1", "quantity": 1, "price_per_unit": 3.0}],
+    "shipping_address": "1 Cold Start Lane",
+}
+
+
+async def probe(service_name: str, started: float) -> dict:
+    """Runs in the child interpreter: time import, lifespan and the first requests"""
+    from _harness import asgi_client, load_service
+    from memory_mongo import MemoryClient
+
+    service = load_service(service_name)
+    imported = time.perf_counter()
+    service.db.client_factory = MemoryClient
+
+    async def call(client, i: int):
+        if service_name == "user_service":
+            email = f"cold-{i}@example.com"
+            await client.post("/users/createUser", json={"email": email, "full_name": "Cold", "password": "pw"})
+            response = await client.post("/token", data={"username": email, "password": "pw"})
+        else:
+            from jose import jwt
+            token = jwt.encode(
+                {"sub": f"cold-{i}@example.com", "user_id": f"64b7f0c2a1b2c3d4e5f6{i:04d}"},
+                service.settings.jwt_secret_key,
+                algorithm=service.settings.jwt_algorithm
+            )
+            response = await client.post("/orders/createOrder", json=ORDER, headers={"Authorization": f"Bearer {token}"})
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.url} -> {response.status_code}: {response.text}")
+
+    async with service.app.router.lifespan_context(service.app):
+        ready = time.perf_counter()
+        async with asgi_client(service.app) as client:
+            latencies = []
+            for i in range(2):
+                start = time.perf_counter()
+                await call(client, i)
+                latencies.append(time.perf_counter() - start)
+
+    return {
+        "imports_ms": (imported - started) * 1000,
+        "ready_ms": (ready - started) * 1000,
+        "first_request_ms": latencies[0] * 1000,
+        "second_request_ms": latencies[1] * 1000,
+    }
+
+
+def child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["AUTH_MODE"] = "local"
+    env.setdefault("MONGO_WARMUP_CONNECTIONS", "1")
+    return env
+
+
+def run_probe(service: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [os.path.abspath(__file__), "--probe", service]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=HERE, env=child_env())
+    if result.returncode != 0:
+        raise RuntimeError(f"{service} probe failed:\n{result.stderr[-2000:]}")
+    return result
+
+
+def import_breakdown(stderr: str, top: int) -> List[tuple]:
+    """Import time (ms) spent in the modules of each top-level package, from -X importtime output"""
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        try:
+            totals[name.strip().split(".")[0]] += int(own) / 1000
+        except ValueError:
+            continue
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
+
+
+def profile(args) -> Dict[str, dict]:
+    results = {}
+    for service in args.services:
+        runs = []
+        for _ in range(args.runs):
+            runs.append(json.loads(run_probe(service).stdout.strip().splitlines()[-1]))
+        results[service] = {metric: statistics.median(run[metric] for run in runs) for metric in METRICS}
+
+        print(f"\n{service} (median of {args.runs}, warm-up {'on' if os.getenv('STARTUP_WARMUP', 'true') == 'true' else 'off'})")
+        for metric in METRICS:
+            print(f"  {metric:18s} {results[service][metric]:9.1f}")
+        if args.breakdown:
+            print("  import time by package (ms, -X importtime):")
+            for package, ms in import_breakdown(run_probe(service, importtime=True).stderr, args.breakdown):
+                print(f"    {package:24s} {ms:8.1f}")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float, floor_ms: float) -> List[str]:
+    """Print the change against the baseline and return the regressed measurements"""
+    regressions = []
+    print(f"\n{'measurement':40s} {'ms':>9s} {'base':>9s} {'delta':>8s}")
+    for service, metrics in results.items():
+        for metric, value in metrics.items():
+            name = f"{service}.{metric}"
+            base = baseline.get(service, {}).get(metric)
+            if base is None:
+                print(f"{name:40s} {value:9.1f} {'-':>9s}")
+                continue
+            delta = (value - base) / base * 100 if base else 0.0
+            flag = ""
+            # Small absolute changes are noise, whatever their relative size
+            if delta > threshold and value - base > floor_ms:
+                regressions.append(name)
+                flag = "  REGRESSION"
+            print(f"{name:40s} {value:9.1f} {base:9.1f} {delta:+7.1f}%{flag}")
+    return regressions
+
+
+def main(args) -> int:
+    results = profile(args)
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {"runs": args.runs, "startup_warmup": os.getenv("STARTUP_WARMUP", "true")},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one")
+        # A regression gate without a baseline would pass whatever the numbers
+        return 2 if args.fail_on_regression is not None else 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    threshold = args.fail_on_regression if args.fail_on_regression is not None else args.threshold
+    regressions = compare(results, baseline, threshold, args.floor_ms)
+    if regressions and args.fail_on_regression is not None:
+        print(f"\n{len(regressions)} startup measurement(s) regressed by more than {threshold}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--probe":
+        started = time.perf_counter()
+        print(json.dumps(asyncio.run(probe(sys.argv[2], started))))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--services", nargs="+", default=["user_service", "order_service"])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per service")
+    parser.add_argument("--breakdown", type=int, default=12, help="packages listed by import time (0 = skip)")
+    parser.add_argument("--output", default=os.path.join(HERE, "results", "startup.json"))
+    parser.add_argument("--baseline", default=os.path.join(HERE, "startup_baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=15.0, help="percent slowdown reported as a regression")
+    parser.add_argument("--floor-ms", type=float, default=20.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--fail-on-regression", type=float, metavar="PERCENT",
+                        help="exit non-zero when a measurement regresses by more than PERCENT")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,50 @@
+"""
+MongoDB queries per request for the User Service auth dependency.
+
+Drives /users/me and /users/{user_id} in-process against the in-memory
+Mongo stand-in, once with the user cache disabled and once enabled.
+
+    python benchmarks/bench_user_cache.py --requests 1000
+"""
+import argparse
+import asyncio
+
+from _harness import Timer, asgi_client, load_service
+from memory_mongo import MemoryClient
+
+
+async def main(args):
+    service = load_service("user_service")
+    auth = load_service("user_service", "auth")
+    service.db.client_factory = MemoryClient
+    cache_size = auth.user_cache.max_size
+
+    async with service.app.router.lifespan_context(service.app):
+        async with asgi_client(service.app) as client:
+            user = {"email": "bench@example.com", "full_name": "Bench User", "password": "password"}
+            await client.post("/users/createUser", json=user)
+            response = await client.post("/token", data={"username": user["email"], "password": user["password"]})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            user_id = (await client.get("/users/me", headers=headers)).json()["id"]
+
+            print(f"requests={args.requests} (half /users/me, half /users/{{user_id}})")
+            for label, size in (("without cache", 0), ("with cache", cache_size)):
+                auth.user_cache.max_size = size
+                auth.user_cache.clear()
+                ops_before = service.db.client.total_ops()
+                with Timer() as timer:
+                    for i in range(args.requests):
+                        path = "/users/me" if i % 2 == 0 else f"/users/{user_id}"
+                        await client.get(path, headers=headers)
+                queries = service.db.client.total_ops() - ops_before
+                print(
+                    f"{label:14s} queries/request={queries / args.requests:6.3f} "
+                    f"req/s={args.requests / timer.elapsed:10.1f}"
+                )
+            print(f"cache stats: {auth.user_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Per-request vs pooled User Service client throughput.
+
+Starts a minimal keep-alive HTTP stub on localhost that answers like
+/users/me, then drives it with a new httpx.AsyncClient per call (the old
+behaviour) and with the pooled client from order_service/user_service.py.
+
+    python benchmarks/bench_user_client.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import httpx
+
+from _harness import Timer, load_service
+
+BODY = json.dumps({
+    "id": "64b7f0c2a1b2c3d4e5f60718",
+    "email": "bench@example.com",
+    "full_name": "Bench User",
+    "created_at": "2024-01-01T00:00:00",
+}).encode()
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Content-Length: " + str(len(BODY)).encode() + b"\r\n\r\n" + BODY
+)
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            if not head:
+                break
+            writer.write(RESPONSE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def drive(call, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await call()
+
+    with Timer() as timer:
+        await asyncio.gather(*(one() for _ in range(total)))
+    return total / timer.elapsed
+
+
+async def main(args):
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}"
+    os.environ["USER_SERVICE_URL"] = url
+    user_service = load_service("order_service", "user_service")
+
+    async def per_request():
+        async with httpx.AsyncClient() as client:
+            await client.get(f"{url}/users/me", headers={"Authorization": "Bearer x"})
+
+    await user_service.start_client()
+
+    async def pooled():
+        await user_service.fetch_current_user("x")
+
+    async with server:
+        per_request_rps = await drive(per_request, args.requests, args.concurrency)
+        pooled_rps = await drive(pooled, args.requests, args.concurrency)
+    await user_service.close_client()
+
+    print(f"requests={args.requests} concurrency={args.concurrency}")
+    print(f"per-request client: {per_request_rps:10.1f} req/s")
+    print(f"pooled client:      {pooled_rps:10.1f} req/s")
+    print(f"speed-up:           {pooled_rps / per_request_rps:10.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Read-your-writes check for secondary reads.
+
+Runs the Order Service with lookups and listings routed to secondaries and
+creates orders, then reads them back right away: in the same process (token
+remembered per user), from "another worker" with the X-Causal-Token header,
+and from another worker without it. By default MongoDB is the in-memory
+stand-in with simulated replication lag; `--mongodb-url` points it at a real
+replica set instead, e.g. `mongod --replSet rs0` after `rs.initiate()`.
+
+    python benchmarks/check_causal_reads.py --orders 200 --lag 0.5
+    python benchmarks/check_causal_reads.py --mongodb-url "mongodb://localhost:27017/?replicaSet=rs0"
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+
+from jose import jwt
+
+from _harness import asgi_client, load_service
+from memory_mongo import MemoryClient
+
+ORDER = {
+    "items": [{"product_id": "sku-1", "quantity": 1, "price_per_unit": 5.0}],
+    "shipping_address": "1 Replica Way",
+}
+
+
+async def main(args) -> int:
+    os.environ.update({
+        "AUTH_MODE": "local",
+        "MONGO_READ_PREFERENCE_LOOKUP": args.read_preference,
+        "MONGO_READ_PREFERENCE_LIST": args.read_preference,
+    })
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ["DATABASE_NAME"] = "causal_reads_check"
+    service = load_service("order_service")
+    consistency = load_service("order_service", "consistency")
+    mongo = None
+    if not args.mongodb_url:
+        mongo = MemoryClient("memory://", replication_lag=args.lag)
+        service.db.client_factory = lambda url, **kwargs: mongo
+
+    token = jwt.encode(
+        {"sub": "causal@example.com", "user_id": "64b7f0c2a1b2c3d4e5f60719"},
+        service.settings.jwt_secret_key,
+        algorithm=service.settings.jwt_algorithm
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def other_worker():
+        # A request landing on another worker has neither the cached order nor the remembered token
+        service.order_cache.clear()
+        consistency.recent_writes.clear()
+
+    results = Counter()
+    async with service.app.router.lifespan_context(service.app):
+        async with asgi_client(service.app) as client:
+            for i in range(args.orders):
+                response = await client.post("/orders/createOrder", json=ORDER, headers=headers)
+                order_id = response.json()["id"]
+                causal_token = response.headers.get("X-Causal-Token")
+
+                service.order_cache.clear()
+                listed = await client.get("/orders/", headers=headers)
+                results["same worker: listed"] += any(order["id"] == order_id for order in listed.json())
+
+                other_worker()
+                listed = await client.get("/orders/", headers={**headers, "X-Causal-Token": causal_token or ""})
+                results["other worker, token: listed"] += any(order["id"] == order_id for order in listed.json())
+
+                other_worker()
+                listed = await client.get("/orders/", headers=headers)
+                results["other worker, no token: listed"] += any(order["id"] == order_id for order in listed.json())
+
+                other_worker()
+                fetched = await client.get(f"/orders/{order_id}", headers=headers)
+                results["other worker, no token: fetched"] += fetched.status_code == 200
+
+        if args.mongodb_url:
+            for partition in service.db.partitions:
+                database = await partition.get_database()
+                await database.client.drop_database(database.name)
+
+    print(f"orders={args.orders} read preference={args.read_preference}"
+          + (f" simulated lag={args.lag}s" if mongo else f" url={args.mongodb_url}"))
+    for name, count in results.items():
+        print(f"{name:34s} {count:5d}/{args.orders}")
+    if mongo:
+        print(f"reads by preference: {dict(mongo.reads)}")
+
+    # Causal reads must always see the write; plain secondary listings may not
+    guaranteed = ("same worker: listed", "other worker, token: listed", "other worker, no token: fetched")
+    failed = [name for name in guaranteed if results[name] != args.orders]
+    if failed:
+        print(f"Read-your-writes violated: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--lag", type=float, default=0.5, help="simulated replication lag in seconds")
+    parser.add_argument("--read-preference", default="secondary")
+    parser.add_argument("--mongodb-url", help="real replica set instead of the stand-in")
+    sys.exit(asyncio.run(main(parser.parse_args())))
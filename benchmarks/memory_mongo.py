@@ -0,0 +1,533 @@
+"""
+In-memory stand-in for the parts of the Motor API the services use.
+
+Injected through `BaseDatabase.client_factory`, so benchmarks run offline
+without a MongoDB server. Every collection operation is counted in
+`MemoryClient.ops` so benchmarks can report queries per request.
+
+With `replication_lag`, reads with a non-primary read preference behave like
+a lagging secondary: documents inserted within the lag are not visible,
+unless the read runs in a causal session that has seen the insert.
+Updates are applied in place and are not delayed.
+
+With `write_slots`, at most that many writes are served at a time, each
+taking the simulated round trip: a server with a write ceiling.
+"""
+import asyncio
+import copy
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, Timestamp
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+def _get(doc: dict, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _compare(value, op: str, arg) -> bool:
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if op == "$ne":
+        return value != arg
+    if op == "$exists":
+        return (value is not None) == bool(arg)
+    if value is None:
+        return False
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    raise NotImplementedError(op)
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    """Evaluate a (subset of the) MongoDB query language against a document"""
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_compare(value, op, arg) for op, arg in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {k: copy.deepcopy(v) for k, v in doc.items() if k in include}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    exclude = {k for k, v in projection.items() if not v}
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in exclude}
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: list):
+        self.inserted_ids = inserted_ids
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class MemorySession:
+    """Causally consistent session: tracks the cluster time of the writes it has seen"""
+
+    def __init__(self, client: "MemoryClient"):
+        self.client = client
+        self.operation_time: Optional[Timestamp] = None
+        self.cluster_time: Optional[dict] = None
+
+    def advance_operation_time(self, operation_time: Timestamp):
+        if self.operation_time is None or operation_time > self.operation_time:
+            self.operation_time = operation_time
+
+    def advance_cluster_time(self, cluster_time: dict):
+        if self.cluster_time is None or cluster_time["clusterTime"] > self.cluster_time["clusterTime"]:
+            self.cluster_time = cluster_time
+
+    async def end_session(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query, projection, session=None):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._session = session
+        self._sort: List[tuple] = []
+        self._limit = 0
+        self._batch_size = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction: int = 1):
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction)]
+        self._sort = list(key_or_list)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int):
+        self._batch_size = batch_size
+        return self
+
+    def _run(self) -> List[dict]:
+        docs = [
+            doc for doc in self._collection.docs
+            if matches(doc, self._query) and self._collection._visible(doc, self._session)
+        ]
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda doc: _get(doc, key), reverse=direction < 0)
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(doc, self._projection) for doc in docs]
+
+    def __aiter__(self):
+        self._results = iter(self._run())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        docs = self._run()
+        return docs[:length] if length else docs
+
+
+class ListCursor:
+    """Async iterator over precomputed results, as returned by aggregate()"""
+
+    def __init__(self, results: List[dict]):
+        self._results = iter(results)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        docs = list(self._results)
+        return docs[:length] if length else docs
+
+
+def _evaluate(doc: dict, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get(doc, expression[1:])
+    if isinstance(expression, dict):
+        return {key: _evaluate(doc, value) for key, value in expression.items()}
+    return expression
+
+
+def _group(docs: List[dict], spec: dict) -> List[dict]:
+    groups: Dict[Any, dict] = {}
+    for doc in docs:
+        group_id = _evaluate(doc, spec["_id"])
+        key = repr(group_id)
+        group = groups.setdefault(key, {"_id": group_id})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, argument), = accumulator.items()
+            value = _evaluate(doc, argument)
+            if op == "$sum":
+                group[field] = group.get(field, 0) + (value or 0)
+            elif op in ("$max", "$min"):
+                current = group.get(field)
+                pick = max if op == "$max" else min
+                group[field] = value if current is None else pick(current, value)
+            else:
+                raise NotImplementedError(op)
+    return list(groups.values())
+
+
+class MemoryCollection:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self.docs: List[dict] = []
+        self.indexes: Dict[str, dict] = {"_id_": {"key": [("_id", 1)], "unique": True}}
+        self.read_preference = None
+        # _id -> (monotonic time, cluster time) of its insert, for simulated replication lag
+        self.inserted_at: Dict[Any, Tuple[float, int]] = {}
+
+    def _count(self, op: str):
+        self.client.ops[(self.name, op)] += 1
+
+    def _count_read(self):
+        mode = self.read_preference.name if self.read_preference is not None else "primary"
+        self.client.reads[mode] += 1
+
+    def _written(self, doc_ids, session):
+        """Advance the cluster time for a write and remember when documents were inserted"""
+        cluster_time = self.client.tick(session)
+        now = time.monotonic()
+        for doc_id in doc_ids:
+            self.inserted_at[doc_id] = (now, cluster_time)
+
+    def _visible(self, doc: dict, session) -> bool:
+        """Whether a read with this collection's read preference sees `doc`"""
+        if not self.client.replication_lag or self.read_preference is None or self.read_preference.mode == 0:
+            return True
+        inserted = self.inserted_at.get(doc.get("_id"))
+        if inserted is None:
+            return True
+        inserted_time, cluster_time = inserted
+        if session is not None and session.operation_time is not None and session.operation_time.time >= cluster_time:
+            # A secondary waits until it has caught up with the session (afterClusterTime)
+            return True
+        return time.monotonic() - inserted_time >= self.client.replication_lag
+
+    def with_read_preference(self, read_preference) -> "MemoryCollection":
+        """A view of this collection sharing its documents"""
+        view = copy.copy(self)
+        view.read_preference = read_preference
+        return view
+
+    async def _io(self, write: bool = False):
+        """Yield to the event loop like a real network round trip would"""
+        if write and self.client.write_slots is not None:
+            async with self.client.write_slots:
+                await asyncio.sleep(self.client.latency)
+        elif self.client.latency:
+            await asyncio.sleep(self.client.latency)
+        else:
+            await asyncio.sleep(0)
+
+    def _prepare(self, document: dict) -> dict:
+        document.setdefault("_id", ObjectId())
+        self._check_unique(document)
+        return copy.deepcopy(document)
+
+    def _check_unique(self, document: dict):
+        for name, index in self.indexes.items():
+            if not index.get("unique"):
+                continue
+            fields = [field for field, _ in index["key"]]
+            values = [_get(document, field) for field in fields]
+            for doc in self.docs:
+                if doc is not document and [_get(doc, field) for field in fields] == values:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {name}", 11000
+                    )
+
+    async def create_indexes(self, models, **kwargs) -> List[str]:
+        self._count("createIndexes")
+        await self._io()
+        for model in models:
+            spec = model.document
+            self.indexes[spec["name"]] = {"key": list(spec["key"].items()), "unique": spec.get("unique", False)}
+        return [model.document["name"] for model in models]
+
+    async def index_information(self) -> Dict[str, dict]:
+        await self._io()
+        return copy.deepcopy(self.indexes)
+
+    async def insert_one(self, document: dict, session=None, **kwargs) -> InsertOneResult:
+        self._count("insert")
+        await self._io(write=True)
+        self.docs.append(self._prepare(document))
+        self._written([document["_id"]], session)
+        return InsertOneResult(document["_id"])
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True, session=None, **kwargs) -> InsertManyResult:
+        self._count("insert")
+        await self._io(write=True)
+        inserted, errors = [], []
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+        for index, document in enumerate(documents):
+            try:
+                self.docs.append(self._prepare(document))
+                inserted.append(document["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        self._written(inserted, session)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return InsertManyResult(inserted)
+
+    async def find_one(self, query: Optional[dict] = None, projection=None, session=None, **kwargs) -> Optional[dict]:
+        self._count("find")
+        self._count_read()
+        await self._io()
+        for doc in self.docs:
+            if matches(doc, query) and self._visible(doc, session):
+                return project(doc, projection)
+        return None
+
+    def find(self, query: Optional[dict] = None, projection=None, session=None, **kwargs) -> MemoryCursor:
+        self._count("find")
+        self._count_read()
+        return MemoryCursor(self, query, projection, session)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        self._count("update")
+        await self._io(write=True)
+        for doc in self.docs:
+            if matches(doc, query):
+                apply_update(doc, update)
+                return UpdateResult(1, 1)
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            self.docs.append(self._prepare(doc))
+            return UpdateResult(0, 0, doc["_id"])
+        return UpdateResult(0, 0)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection=None,
+                                  return_document: bool = False, upsert: bool = False,
+                                  session=None, **kwargs) -> Optional[dict]:
+        self._count("findAndModify")
+        await self._io(write=True)
+        self.client.tick(session)
+        for doc in self.docs:
+            if matches(doc, query):
+                before = project(doc, projection)
+                apply_update(doc, update)
+                return project(doc, projection) if return_document else before
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            self.docs.append(self._prepare(doc))
+            return project(doc, projection) if return_document else None
+        return None
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        self._count("update")
+        await self._io(write=True)
+        for index, doc in enumerate(self.docs):
+            if matches(doc, query):
+                replacement = copy.deepcopy(replacement)
+                replacement["_id"] = doc["_id"]
+                self.docs[index] = replacement
+                return UpdateResult(1, 1)
+        if upsert:
+            self.docs.append(self._prepare(dict(replacement)))
+            return UpdateResult(0, 0, self.docs[-1]["_id"])
+        return UpdateResult(0, 0)
+
+    async def delete_one(self, query: dict, **kwargs):
+        self._count("delete")
+        await self._io(write=True)
+        for index, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[index]
+                break
+
+    async def delete_many(self, query: dict, **kwargs):
+        self._count("delete")
+        await self._io(write=True)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+
+    def aggregate(self, pipeline: List[dict], **kwargs) -> ListCursor:
+        """$match, $group ($sum/$max/$min), $sort and $limit stages"""
+        self._count("aggregate")
+        docs = [copy.deepcopy(doc) for doc in self.docs]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif name == "$group":
+                docs = _group(docs, spec)
+            elif name == "$sort":
+                for key, direction in reversed(list(spec.items())):
+                    docs.sort(key=lambda doc: _get(doc, key), reverse=direction < 0)
+            elif name == "$limit":
+                docs = docs[:spec]
+            else:
+                raise NotImplementedError(name)
+        return ListCursor(docs)
+
+    async def count_documents(self, query: dict, **kwargs) -> int:
+        self._count("count")
+        await self._io()
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    """Apply $set/$inc/$max/$min/$unset/$setOnInsert operators in place"""
+    for op, fields in update.items():
+        for path, value in fields.items():
+            *parents, leaf = path.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                target[leaf] = copy.deepcopy(value)
+            elif op == "$inc":
+                target[leaf] = target.get(leaf, 0) + value
+            elif op == "$max":
+                target[leaf] = value if target.get(leaf) is None else max(target[leaf], value)
+            elif op == "$min":
+                target[leaf] = value if target.get(leaf) is None else min(target[leaf], value)
+            elif op == "$unset":
+                target.pop(leaf, None)
+            elif op != "$setOnInsert":
+                raise NotImplementedError(op)
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self.client, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, read_preference=None, **kwargs) -> MemoryCollection:
+        if read_preference is None:
+            return self[name]
+        return self[name].with_read_preference(read_preference)
+
+    async def command(self, command, **kwargs) -> dict:
+        await asyncio.sleep(0)
+        return {"ok": 1.0}
+
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient(url, **options)"""
+
+    def __init__(self, url: str = "memory://", latency: float = 0.0, replication_lag: float = 0.0,
+                 write_slots: int = 0, **kwargs):
+        self.url = url
+        self.latency = latency
+        self.replication_lag = replication_lag
+        self.write_slots = asyncio.Semaphore(write_slots) if write_slots else None
+        self.ops: Counter = Counter()
+        # Reads by read preference mode name
+        self.reads: Counter = Counter()
+        self.cluster_time = 0
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def tick(self, session=None) -> int:
+        """Advance the cluster time for a write, and the session that made it"""
+        self.cluster_time += 1
+        if session is not None:
+            timestamp = Timestamp(self.cluster_time, 1)
+            session.advance_operation_time(timestamp)
+            session.advance_cluster_time({"clusterTime": timestamp})
+        return self.cluster_time
+
+    async def start_session(self, causal_consistency: bool = True, **kwargs) -> MemorySession:
+        return MemorySession(self)
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    @property
+    def admin(self) -> MemoryDatabase:
+        return self["admin"]
+
+    def total_ops(self) -> int:
+        return sum(self.ops.values())
+
+    def close(self):
+        pass
@@ -0,0 +1,185 @@
+"""
+Benchmark suite for both services, in-process and offline.
+
+Both apps run through httpx's ASGI transport on the in-memory Mongo
+stand-in, with the Order Service calling the User Service in-process.
+Each scenario reports throughput and p50/p95/p99 latency; results are
+written as JSON and compared against a stored baseline.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --update-baseline
+    python benchmarks/suite.py --fail-on-regression 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+from _harness import percentile, service_stack
+from memory_mongo import MemoryClient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ORDER = {
+    "items": [{"product_id": "sku-1", "quantity": 2, "price_per_unit": 9.99}],
+    "shipping_address": "123 Main St",
+}
+
+
+async def run_scenario(call: Callable[[int], Awaitable[None]], total: int, concurrency: int) -> dict:
+    """Run `call(i)` `total` times with bounded concurrency and summarise the latencies"""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": total,
+        "throughput": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text}")
+    return response
+
+
+async def run_suite(args) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    factory = lambda url, **kwargs: MemoryClient(url, latency=args.latency)
+
+    async with service_stack(factory) as stack:
+        users, orders = stack.user_client, stack.order_client
+
+        async def create_and_login(i: int):
+            await stack.create_user(f"load-{i}@example.com")
+
+        results["user.create_login"] = await run_scenario(create_and_login, args.logins, args.concurrency)
+
+        headers = await stack.create_user("orders@example.com")
+        order_ids: List[str] = []
+
+        async def create_order(i: int):
+            response = checked(await orders.post("/orders/createOrder", json=ORDER, headers=headers))
+            order_ids.append(response.json()["id"])
+
+        async def get_order(i: int):
+            checked(await orders.get(f"/orders/{order_ids[i % len(order_ids)]}", headers=headers))
+
+        async def update_order(i: int):
+            checked(await orders.put(
+                f"/orders/{order_ids[i % len(order_ids)]}",
+                json={"shipping_address": f"{i} Main St"},
+                headers=headers
+            ))
+
+        async def get_me(i: int):
+            checked(await users.get("/users/me", headers=headers))
+
+        results["user.me"] = await run_scenario(get_me, args.requests, args.concurrency)
+        results["order.create"] = await run_scenario(create_order, args.requests, args.concurrency)
+        results["order.get"] = await run_scenario(get_order, args.requests, args.concurrency)
+        results["order.update"] = await run_scenario(update_order, args.requests, args.concurrency)
+
+        for size in args.list_sizes:
+            list_headers = await stack.create_user(f"list-{size}@example.com")
+            for start in range(0, size, 1000):
+                batch = [ORDER] * min(1000, size - start)
+                checked(await orders.post("/orders/createOrders", json=batch, headers=list_headers))
+
+            async def list_orders(i: int):
+                checked(await orders.get("/orders/", headers=list_headers))
+
+            total = max(5, min(args.requests, args.requests * 100 // size))
+            results[f"order.list[{size}]"] = await run_scenario(list_orders, total, args.concurrency)
+
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Print the change against the baseline and return the regressed scenarios"""
+    regressions = []
+    print(f"\n{'scenario':24s} {'req/s':>10s} {'base':>10s} {'delta':>8s} {'p99 ms':>9s} {'base':>9s}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:24s} {result['throughput']:10.1f} {'-':>10s} {'':>8s} {result['p99_ms']:9.2f}")
+            continue
+        delta = (result["throughput"] - base["throughput"]) / base["throughput"] * 100
+        flag = ""
+        if delta < -threshold or result["p99_ms"] > base["p99_ms"] * (1 + threshold / 100):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:24s} {result['throughput']:10.1f} {base['throughput']:10.1f} {delta:+7.1f}% "
+            f"{result['p99_ms']:9.2f} {base['p99_ms']:9.2f}{flag}"
+        )
+    return regressions
+
+
+def main(args):
+    results = asyncio.run(run_suite(args))
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one")
+        compare(results, {}, 0)
+        # A regression gate without a baseline would pass whatever the numbers
+        return 2 if args.fail_on_regression is not None else 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    threshold = args.fail_on_regression if args.fail_on_regression is not None else args.threshold
+    regressions = compare(results, baseline, threshold)
+    if regressions and args.fail_on_regression is not None:
+        print(f"\n{len(regressions)} scenario(s) regressed by more than {threshold}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--logins", type=int, default=50, help="user creations + logins (bcrypt bound)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--list-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Mongo round trip in seconds")
+    parser.add_argument("--output", default=os.path.join(HERE, "results", "latest.json"))
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change reported as a regression")
+    parser.add_argument("--fail-on-regression", type=float, metavar="PERCENT",
+                        help="exit non-zero when a scenario regresses by more than PERCENT")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,70 @@
+"""
+Local JWT verification for Order Service.
+Validates tokens issued by the User Service without a network round trip.
+"""
+import json
+from typing import Optional
+
+from jose import JWTError, jwk, jwt
+from fastapi import HTTPException
+from config import settings
+
+_jwks: Optional[dict] = None
+_public_key: Optional[str] = None
+
+
+def load_keys():
+    """Load the configured public key and key set once, at startup"""
+    global _jwks, _public_key
+    if settings.jwt_jwks_file:
+        with open(settings.jwt_jwks_file) as f:
+            _jwks = {key.get("kid"): key for key in json.load(f).get("keys", [])}
+    if settings.jwt_public_key_file:
+        with open(settings.jwt_public_key_file) as f:
+            _public_key = f.read()
+
+
+def _signing_key(token: str):
+    """Pick the verification key: a cached JWK by `kid`, a public key, or the shared secret"""
+    if _jwks:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid in _jwks:
+            return _jwks[kid]
+        raise JWTError("Unknown key id")
+    if _public_key:
+        return _public_key
+    return settings.jwt_secret_key
+
+
+def warm_up():
+    """Construct the verification keys once, which loads the JOSE crypto backend before the first request"""
+    if _jwks:
+        for key in _jwks.values():
+            jwk.construct(key, algorithm=key.get("alg", settings.jwt_algorithm))
+    elif _public_key:
+        jwk.construct(_public_key, algorithm=settings.jwt_algorithm)
+    else:
+        token = jwt.encode({"sub": "warm-up"}, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
+        jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
+
+
+def verify_token_locally(token: str) -> dict:
+    """
+    Decode and validate a JWT issued by `create_access_token` in the User Service.
+    Returns the current user built from the `sub` and `user_id` claims.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            _signing_key(token),
+            algorithms=[settings.jwt_algorithm]
+        )
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    email = payload.get("sub")
+    user_id = payload.get("user_id")
+    if email is None or user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    return {"id": user_id, "email": email}
@@ -0,0 +1,139 @@
+"""
+Group commit for single-order inserts.
+Concurrent create_order calls are collected for up to a few milliseconds
+(or until a batch is full) and written with one unordered insert_many.
+Each caller still gets its own inserted id (and the causal token of the
+batch) or its own error, with the same write concern as insert_one.
+Each partition of the orders has its own batcher.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteConcernError, WriteError
+
+from config import settings
+from shared.utils.metrics import REGISTRY
+
+insert_batch_size = REGISTRY.histogram(
+    "order_insert_batch_size", "Orders written per group-commit insert_many",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+
+def _write_error(error: dict) -> WriteError:
+    """The exception insert_one raises for this write error"""
+    if error.get("code") == 11000:
+        return DuplicateKeyError(error.get("errmsg"), error.get("code"), error)
+    return WriteError(error.get("errmsg"), error.get("code"), error)
+
+
+class InsertBatcher:
+    """
+    Buffers inserts into one collection and flushes them after `max_delay`
+    seconds or once `max_batch` documents are waiting, whichever comes first.
+    """
+
+    def __init__(self, max_delay: float, max_batch: int):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._database = None
+        self._name = None
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    def start(self, database, name: str):
+        """Bind the batcher to a collection of a BaseDatabase"""
+        self._database = database
+        self._name = name
+
+    async def shutdown(self):
+        """Flush buffered inserts and wait for the writes in flight"""
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        self._database = None
+
+    async def insert(self, document: dict) -> Tuple[ObjectId, Optional[str]]:
+        """Insert `document` in the next batch; return its id and the causal token of the write"""
+        if self._database is None:
+            raise RuntimeError("Insert batcher is not started")
+        document.setdefault("_id", ObjectId())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((document, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._write(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: List[Tuple[dict, asyncio.Future]]):
+        insert_batch_size.observe(len(batch))
+        errors = {}
+        concern_error = None
+        token = None
+        try:
+            collection = await self._database.collection(self._name)
+            async with self._database.causal_session() as session:
+                try:
+                    await collection.insert_many([document for document, _ in batch], ordered=False, session=session)
+                finally:
+                    token = self._database.causal_token(session)
+        except BulkWriteError as e:
+            errors = {error["index"]: _write_error(error) for error in e.details.get("writeErrors", [])}
+            concern_errors = e.details.get("writeConcernErrors", [])
+            if concern_errors:
+                concern_error = WriteConcernError(
+                    concern_errors[-1].get("errmsg"), concern_errors[-1].get("code"), concern_errors[-1]
+                )
+        except Exception as e:
+            # Network errors, timeouts...: every caller sees what insert_one would have raised
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (document, future) in enumerate(batch):
+            if future.done():
+                # The caller went away; its document was written regardless, as with insert_one
+                continue
+            if i in errors:
+                future.set_exception(errors[i])
+            elif concern_error is not None:
+                future.set_exception(concern_error)
+            else:
+                future.set_result((document["_id"], token))
+
+
+_batchers: Dict[object, InsertBatcher] = {}
+
+
+def order_batcher(database) -> InsertBatcher:
+    """The batcher of the orders of one partition, started on first use"""
+    batcher = _batchers.get(database)
+    if batcher is None:
+        batcher = _batchers[database] = InsertBatcher(
+            max_delay=settings.order_insert_batch_delay_ms / 1000,
+            max_batch=settings.order_insert_batch_max,
+        )
+        batcher.start(database, "orders")
+    return batcher
+
+
+async def shutdown_batchers():
+    """Flush and stop the batchers of all partitions"""
+    batchers = list(_batchers.values())
+    _batchers.clear()
+    await asyncio.gather(*(batcher.shutdown() for batcher in batchers))
@@ -0,0 +1,62 @@
+"""
+Optimistic concurrency helpers for order updates.
+Orders carry a `version` that is incremented on every update and exposed as the ETag.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+
+from shared.models.order import ORDER_STATUS_TRANSITIONS, OrderStatus
+
+
+def order_etag(order: dict) -> str:
+    """Strong ETag for an order document"""
+    return f'"{order.get("version", 0)}"'
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """
+    Expected order version from an If-Match header; None for a missing header or `*`.
+    If-Match uses strong comparison (RFC 9110), so a weak tag never matches: 412.
+    """
+    if value is None or value.strip() == "*":
+        return None
+    tag = value.strip()
+    if tag.startswith("W/"):
+        raise HTTPException(status_code=412, detail="If-Match requires a strong ETag")
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison)"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def version_filter(version: int):
+    """Query condition matching orders at `version`"""
+    # Orders written before versioning have no version field and count as version 0
+    return {"$exists": False} if version == 0 else version
+
+
+def can_transition(current: str, new_status: OrderStatus) -> bool:
+    """Whether an order in status `current` may move to `new_status`"""
+    return current == new_status or new_status in ORDER_STATUS_TRANSITIONS[OrderStatus(current)]
+
+
+def transition_filter(new_status: OrderStatus) -> dict:
+    """Query condition matching orders whose current status may change to `new_status`"""
+    allowed = [status for status, targets in ORDER_STATUS_TRANSITIONS.items() if new_status in targets]
+    # Re-applying the current status is an idempotent no-op
+    allowed.append(new_status)
+    return {"$in": allowed}
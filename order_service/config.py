@@ -3,13 +3,106 @@ Configuration management for Order Service.
 """
 import os
 
+from shared.utils.base_database import derived_key, read_mongo_settings
+
 
 class Settings:
     def __init__(self):
         self.mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
         self.database_name = os.getenv("DATABASE_NAME", "order_service_db")
         self.user_service_url = os.getenv("USER_SERVICE_URL", "http://localhost:8000")
-        self.service_port = 8001
+        self.service_port = int(os.getenv("SERVICE_PORT", "8001"))
+        # Process model when started through main.py
+        self.workers = int(os.getenv("WORKERS", "1"))
+        self.reload = os.getenv("RELOAD", "false").lower() == "true"
+        self.graceful_shutdown_timeout = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "20"))
+        # Time budget of each request; callers can lower it with X-Request-Timeout (ms)
+        self.request_timeout = float(os.getenv("REQUEST_TIMEOUT", "10"))
+        # Build schemas and prime the auth backends in the lifespan, before the service reports ready
+        self.startup_warmup = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+        # MongoDB pool, compression, concerns, warm-up and read preferences (MONGO_*)
+        read_mongo_settings(self)
+        # Orders partitioned by user_id: ";" separated Mongo URLs, the database name in the URL path
+        # (default DATABASE_NAME); empty = MONGODB_URL only. Routing table entries are cached per process
+        self.order_partitions = os.getenv("ORDER_PARTITIONS", "")
+        self.partition_routing_ttl = float(os.getenv("PARTITION_ROUTING_TTL", "2"))
+        self.partition_routing_cache_size = int(os.getenv("PARTITION_ROUTING_CACHE_SIZE", "100000"))
+
+        # Admission control: per-route concurrency caps ("METHOD /route=limit,..." overrides,
+        # 0 = unlimited), bounded wait queue and queue-time budget, per-client token buckets (0 = off)
+        self.admission_max_concurrency = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))
+        self.admission_route_limits = os.getenv("ADMISSION_ROUTE_LIMITS", "")
+        self.admission_max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+        self.admission_queue_timeout_ms = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "200"))
+        self.admission_client_rate = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+        self.admission_client_burst = float(os.getenv("ADMISSION_CLIENT_BURST", "20"))
+        # Key required in the X-Admin-Key header of admin endpoints; unset disables them
+        self.admin_api_key = os.getenv("ADMIN_API_KEY")
+        # Request profiling: a sampled fraction of requests (0 = off) and requests whose X-Profile-Key
+        # holds ADMIN_API_KEY; collapsed stacks kept in memory and also written to PROFILE_DIR if set
+        self.profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.profile_interval_ms = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+        self.profile_dir = os.getenv("PROFILE_DIR", "")
+        self.profile_keep = int(os.getenv("PROFILE_KEEP", "50"))
+        # Event loop lag measurement (0 = off) and the stall recorded as a blocking section
+        self.loop_lag_interval_ms = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+        self.blocking_threshold_ms = float(os.getenv("BLOCKING_THRESHOLD_MS", "100"))
+
+        # Order listing: page size limit and Mongo cursor batch size
+        self.list_orders_max_limit = int(os.getenv("LIST_ORDERS_MAX_LIMIT", "1000"))
+        self.list_orders_batch_size = int(os.getenv("LIST_ORDERS_BATCH_SIZE", "100"))
+        self.list_orders_max_batch_size = int(os.getenv("LIST_ORDERS_MAX_BATCH_SIZE", "10000"))
+
+        # Admin NDJSON export/import: cursor batch size, import chunk size and chunks in flight
+        self.export_batch_size = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+        self.import_chunk_size = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+        self.import_concurrency = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+
+        # Largest accepted batch for bulk order creation
+        self.bulk_orders_max_batch = int(os.getenv("BULK_ORDERS_MAX_BATCH", "1000"))
+
+        # Group commit: createOrder inserts from concurrent requests share one insert_many
+        self.order_insert_batching = os.getenv("ORDER_INSERT_BATCHING", "false").lower() == "true"
+        self.order_insert_batch_delay_ms = float(os.getenv("ORDER_INSERT_BATCH_DELAY_MS", "2"))
+        self.order_insert_batch_max = int(os.getenv("ORDER_INSERT_BATCH_MAX", "100"))
+
+        # Token verification: "remote" asks the User Service, "local" decodes the JWT here
+        self.auth_mode = os.getenv("AUTH_MODE", "remote").lower()
+        self.jwt_secret_key = os.getenv("JWT_SECRET_KEY", "sEcReT")
+        self.jwt_algorithm = os.getenv("JWT_ALGORITHM", "HS256")
+        # Signs X-Causal-Token values; unset derives a separate key from JWT_SECRET_KEY
+        self.causal_token_key = os.getenv("CAUSAL_TOKEN_KEY") or derived_key(self.jwt_secret_key, "causal-token")
+        self.jwt_public_key_file = os.getenv("JWT_PUBLIC_KEY_FILE")
+        self.jwt_jwks_file = os.getenv("JWT_JWKS_FILE")
+
+        # Pooled HTTP client used for User Service calls
+        self.user_service_max_connections = int(os.getenv("USER_SERVICE_MAX_CONNECTIONS", "100"))
+        self.user_service_max_keepalive = int(os.getenv("USER_SERVICE_MAX_KEEPALIVE", "20"))
+        self.user_service_keepalive_expiry = float(os.getenv("USER_SERVICE_KEEPALIVE_EXPIRY", "30"))
+        self.user_service_http2 = os.getenv("USER_SERVICE_HTTP2", "false").lower() == "true"
+        self.user_service_connect_timeout = float(os.getenv("USER_SERVICE_CONNECT_TIMEOUT", "2"))
+        self.user_service_read_timeout = float(os.getenv("USER_SERVICE_READ_TIMEOUT", "5"))
+        # Retries of failed User Service calls, limited to a fraction of all calls
+        self.user_service_max_retries = int(os.getenv("USER_SERVICE_MAX_RETRIES", "2"))
+        self.user_service_retry_ratio = float(os.getenv("USER_SERVICE_RETRY_RATIO", "0.1"))
+        self.user_service_retry_max_tokens = float(os.getenv("USER_SERVICE_RETRY_MAX_TOKENS", "10"))
+        self.user_service_retry_backoff = float(os.getenv("USER_SERVICE_RETRY_BACKOFF", "0.05"))
+        # Circuit breaker: opens after N consecutive failures, probes again after the reset timeout
+        self.user_service_breaker_threshold = int(os.getenv("USER_SERVICE_BREAKER_THRESHOLD", "5"))
+        self.user_service_breaker_reset_timeout = float(os.getenv("USER_SERVICE_BREAKER_RESET_TIMEOUT", "10"))
+        self.user_service_breaker_half_open_calls = int(os.getenv("USER_SERVICE_BREAKER_HALF_OPEN_CALLS", "1"))
+
+        # Cache of remote token verification results
+        self.token_cache_size = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+        self.token_cache_ttl = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+        self.token_cache_negative_ttl = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", "5"))
+
+        # Read-through cache of order documents; per process, so keep the TTL short with several workers
+        self.order_cache_size = int(os.getenv("ORDER_CACHE_SIZE", "10000"))
+        self.order_cache_ttl = float(os.getenv("ORDER_CACHE_TTL", "5"))
+        # How long reads of a user that just wrote are pinned to that write (causal consistency)
+        self.causal_token_ttl = float(os.getenv("CAUSAL_TOKEN_TTL", "30"))
 
 
 settings = Settings()
@@ -0,0 +1,37 @@
+"""
+Read-your-writes for reads served by secondaries.
+Every order write hands out a causal token (X-Causal-Token response header)
+and remembers it for the writing user. Reads that carry a token, or that come
+from a user who wrote recently, run in a causal session advanced to that
+point, so even a lagging secondary answers with the user's own writes.
+"""
+from typing import List, Optional
+
+from config import settings
+from shared.utils.cache import TTLCache
+
+CAUSAL_TOKEN_HEADER = "X-Causal-Token"
+
+# Latest causal token per user that wrote in this process
+recent_writes = TTLCache(max_size=settings.order_cache_size, ttl=settings.causal_token_ttl)
+
+
+def remember_write(user_id: str, token: Optional[str]) -> dict:
+    """Record a user's write; returns the response headers carrying its token"""
+    if not token:
+        return {}
+    recent_writes.set(user_id, token)
+    return {CAUSAL_TOKEN_HEADER: token}
+
+
+def written_elsewhere(user_id: str, header: Optional[str]) -> bool:
+    """
+    Whether a read's token may come from a write made by another process (or
+    an earlier one of this process), which the local caches may not reflect
+    """
+    return bool(header) and header != recent_writes.get(user_id)
+
+
+def read_tokens(user_id: str, header: Optional[str]) -> List[str]:
+    """Causal tokens a read by `user_id` must respect"""
+    return [token for token in (header, recent_writes.get(user_id)) if token]
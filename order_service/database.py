@@ -1,9 +1,44 @@
+from pymongo import ASCENDING, IndexModel
+
 from config import settings
-from shared.utils.base_database import BaseDatabase
+from shared.utils.base_database import LIST, LOOKUP, BaseDatabase, client_options_from
+from shared.utils.partitioning import PartitionedDatabase, parse_partitions
 
 
 class Database(BaseDatabase):
-    def __init__(self):
-        super().__init__(settings.mongodb_url, settings.database_name)
+    indexes = {
+        "orders": [
+            IndexModel(
+                [("user_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+                name="user_id_status_created_at_id"
+            ),
+            IndexModel(
+                [("user_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+                name="user_id_created_at_id"
+            ),
+        ],
+    }
+
+    def __init__(self, mongodb_url: str, database_name: str):
+        super().__init__(
+            mongodb_url,
+            database_name,
+            client_options=client_options_from(settings),
+            warmup_connections=settings.mongo_warmup_connections,
+            read_preferences={
+                LOOKUP: settings.mongo_read_preference_lookup,
+                LIST: settings.mongo_read_preference_list,
+            },
+            max_staleness=settings.mongo_max_staleness_seconds,
+            # Scoped to the partition: its cluster times mean nothing to another one
+            causal_token_key=f"{settings.causal_token_key}:{mongodb_url}/{database_name}"
+        )
 
-db = Database()
\ No newline at end of file
+db = PartitionedDatabase(
+    [
+        Database(url, name)
+        for url, name in parse_partitions(settings.order_partitions, settings.mongodb_url, settings.database_name)
+    ],
+    routing_ttl=settings.partition_routing_ttl,
+    routing_cache_size=settings.partition_routing_cache_size
+)
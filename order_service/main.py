@@ -1,31 +1,75 @@
 """
 FastAPI application for Order Service
 """
+# First, so that the startup profile times every other import
+from shared.utils.startup import StartupProfile, warm_up
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
 
 from bson import ObjectId
 from datetime import datetime
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List, Set
 import uvicorn
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 
 from shared.models.order import (
+    BulkOrderResponse,
+    BulkOrderResult,
     OrderCreate,
     OrderResponse,
+    OrderSummary,
     OrderUpdate,
     OrderStatus,
 )
 from shared.utils.responses import (
     APIResponse,
+    FastJSONResponse,
+    dumps,
+    serialize_document,
     validation_exception_handler,
     http_exception_handler,
     general_exception_handler
 )
+from shared.utils.admin import require_admin
+from shared.utils.base_database import LIST, PRIMARY, BaseDatabase
+from shared.utils.health import install_health
+from shared.utils.ndjson import LineTooLong, export_documents, export_query, import_documents, iter_lines
+from shared.utils.admission import install_admission
+from shared.utils.metrics import REGISTRY, install_metrics
+from shared.utils.profiling import install_profiling
+from shared.utils.partitioning import OwnerMoving
+from shared.utils.resilience import install_deadlines
 from database import db
 from config import settings
-from user_service import verify_user_token
+from user_service import (
+    close_client,
+    resilience_metric_lines,
+    resilience_stats,
+    start_client,
+    token_cache,
+    verify_user_token,
+)
+from auth import load_keys, verify_token_locally, warm_up as warm_up_auth
+from concurrency import can_transition, etag_matches, order_etag, parse_if_match, transition_filter, version_filter
+from batching import order_batcher, shutdown_batchers
+from consistency import read_tokens, remember_write, written_elsewhere
+from order_cache import cache_order, get_cached_order, invalidate_order, order_cache
+from summaries import get_summary, recompute_summaries, record_created, record_status_change
+from pagination import (
+    ORDER_SORT,
+    decode_cursor,
+    encode_cursor,
+    parse_fields,
+    projection_for,
+    select_fields,
+)
+
+startup = StartupProfile("Order Service")
+startup.mark("imports")
 
 
 @asynccontextmanager
@@ -36,12 +80,25 @@ async def lifespan(app_: FastAPI):
     """
     # Startup
     print("Starting up...")
+    startup.mark("app")
     await db.connect_db()
+    await db.ensure_indexes()
+    startup.mark("mongo")
+    await start_client()
+    load_keys()
+    if settings.startup_warmup:
+        await warm_up(app_, warm_up_models, warm_up_auth)
+        startup.mark("warm_up")
+    profiler.start()
+    print(startup.report())
 
     yield  # Server is running and handling requests
 
     # Shutdown
     print("Shutting down...")
+    await profiler.stop()
+    await shutdown_batchers()
+    await close_client()
     await db.close_db()
 
 app = FastAPI(
@@ -51,14 +108,28 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Last added runs first: CORS headers reach every response, shed ones included; metrics see
+# shed requests, admission control sees the deadline and only admitted requests are profiled
+profiler = install_profiling(app, settings)
+install_admission(app, settings)
+install_deadlines(app, settings.request_timeout)
+install_metrics(app, db)
+# CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Readable by browser clients, e.g. Retry-After on shed requests
+    expose_headers=["Retry-After", "ETag", "X-Next-Cursor", "X-Causal-Token", "X-Profile-Id"],
 )
 
+REGISTRY.register_cache("token", token_cache)
+REGISTRY.register_cache("order", order_cache)
+REGISTRY.collector(resilience_metric_lines)
+REGISTRY.collector(startup.metric_lines)
+
 # Add exception handlers
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 app.add_exception_handler(HTTPException, http_exception_handler)
@@ -72,113 +143,419 @@ async def get_current_user(authorization: str = Header(...)):
     scheme, token = authorization.split()
     if scheme.lower() != 'bearer':
         raise HTTPException(status_code=401, detail="Invalid authentication scheme")
+    if settings.auth_mode == "local":
+        return verify_token_locally(token)
     return await verify_user_token(token)
 
 
-@app.post("/orders/createOrder", response_model=OrderResponse, status_code=201)
-async def create_order(
-        order: OrderCreate,
-        current_user: dict = Depends(get_current_user)
-):
+async def partition_for(user_id: str, write: bool = False) -> BaseDatabase:
     """
-    Create a new order
+    The partition holding a user's orders and summary.
+    Writes are answered 503 while the user's orders are being moved to another partition.
     """
-    database = await db.get_database()
-    total_amount = sum(item.price_per_unit * item.quantity for item in order.items)
+    try:
+        return await db.for_owner(user_id, write)
+    except OwnerMoving as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Orders are being moved, retry shortly",
+            headers={"Retry-After": str(max(1, int(e.retry_after + 0.5)))}
+        )
+
+
+def build_order(order: OrderCreate, user_id: str, now: datetime) -> dict:
+    """Build the order document stored for a new order"""
     order_dict = order.model_dump()
     order_dict.update({
         "status": OrderStatus.PENDING,
-        "total_amount": total_amount,
-        "created_at": datetime.now(),
-        "updated_at": datetime.now(),
-        "user_id": current_user["id"]
+        "total_amount": sum(item.price_per_unit * item.quantity for item in order.items),
+        "created_at": now,
+        "updated_at": now,
+        "user_id": user_id,
+        "version": 1
     })
+    return order_dict
 
-    result = await database.orders.insert_one(order_dict)
-    order_dict["id"] = str(result.inserted_id)
 
+def warm_up_models():
+    """Validate, build and serialize a sample order once, ahead of the first request"""
+    order = OrderCreate.model_validate({
+        "items": [{"product_id": "warm-up", "quantity": 1, "price_per_unit": 1.0}],
+        "shipping_address": "warm-up",
+    })
+    document = build_order(order, "warm-up", datetime.now())
+    document["_id"] = ObjectId()
+    FastJSONResponse(serialize_document(document, OrderResponse))
+    OrderResponse(**document, id=str(document["_id"])).model_dump(mode="json")
+    OrderSummary(user_id="warm-up").model_dump(mode="json")
+
+
+@app.post("/orders/createOrder", response_model=OrderResponse, status_code=201)
+async def create_order(
+        order: OrderCreate,
+        response: Response,
+        current_user: dict = Depends(get_current_user)
+):
+    """
+    Create a new order.
+    With ORDER_INSERT_BATCHING the insert is group-committed with concurrent requests.
+    """
+    partition = await partition_for(current_user["id"], write=True)
+    database = await partition.get_database()
+    order_dict = build_order(order, current_user["id"], datetime.now())
+
+    if settings.order_insert_batching:
+        _, token = await order_batcher(partition).insert(order_dict)
+    else:
+        async with partition.causal_session() as session:
+            await database.orders.insert_one(order_dict, session=session)
+            token = partition.causal_token(session)
+    response.headers.update(remember_write(current_user["id"], token))
+    await record_created(database, current_user["id"], [order_dict])
+    # New orders are usually polled right away
+    cache_order(dict(order_dict))
+    order_dict["id"] = str(order_dict["_id"])
+
+    response.headers["ETag"] = order_etag(order_dict)
     return OrderResponse(**order_dict)
 
 
+@app.post("/orders/createOrders", response_model=BulkOrderResponse)
+async def create_orders(
+        orders: List[OrderCreate],
+        response: Response,
+        current_user: dict = Depends(get_current_user)
+):
+    """
+    Create a batch of orders with a single unordered insert.
+    Reports success or failure for each order, by its index in the request.
+    """
+    if not orders:
+        raise HTTPException(status_code=400, detail="No orders given")
+    if len(orders) > settings.bulk_orders_max_batch:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.bulk_orders_max_batch} orders per batch"
+        )
+
+    partition = await partition_for(current_user["id"], write=True)
+    database = await partition.get_database()
+    now = datetime.now()
+    documents = [build_order(order, current_user["id"], now) for order in orders]
+
+    errors = {}
+    async with partition.causal_session() as session:
+        try:
+            await database.orders.insert_many(documents, ordered=False, session=session)
+        except BulkWriteError as e:
+            errors = {error["index"]: error.get("errmsg", "Write error") for error in e.details.get("writeErrors", [])}
+            concern_errors = e.details.get("writeConcernErrors", [])
+            if concern_errors:
+                # Applied but not acknowledged at the requested write concern, as insert_one would
+                # have raised: every order without a write error of its own is reported failed
+                message = f"Write concern not satisfied: {concern_errors[-1].get('errmsg', 'write concern error')}"
+                errors.update({i: message for i in range(len(documents)) if i not in errors})
+        token = partition.causal_token(session)
+    response.headers.update(remember_write(current_user["id"], token))
+
+    await record_created(
+        database,
+        current_user["id"],
+        [document for i, document in enumerate(documents) if i not in errors]
+    )
+
+    results = [
+        BulkOrderResult(index=i, success=False, error=errors[i]) if i in errors
+        else BulkOrderResult(index=i, success=True, id=str(document["_id"]))
+        for i, document in enumerate(documents)
+    ]
+    return BulkOrderResponse(inserted=len(documents) - len(errors), failed=len(errors), results=results)
+
+
+@app.get("/orders/summary", response_model=OrderSummary)
+async def get_order_summary(current_user: dict = Depends(get_current_user)):
+    """
+    Order counts per status, lifetime spend and last order date of the current user.
+    """
+    database = await (await partition_for(current_user["id"])).get_database()
+    summary = await get_summary(database, current_user["id"]) or {"_id": current_user["id"]}
+    summary["user_id"] = summary.pop("_id")
+    return OrderSummary(**summary)
+
+
 @app.get("/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
         order_id: str,
-        current_user: dict = Depends(get_current_user)
+        current_user: dict = Depends(get_current_user),
+        if_none_match: Optional[str] = Header(None),
+        x_causal_token: Optional[str] = Header(None)
 ):
     """
-    Get order by ID.
+    Get order by ID, through the order cache.
+    Answers 304 Not Modified when `If-None-Match` holds the current ETag.
+    An `X-Causal-Token` from an earlier write guarantees that write is seen.
     """
-    database = await db.get_database()
-    order = await database.orders.find_one({
-        "_id": ObjectId(order_id),
-        "user_id": current_user["id"]
-    })
+    partition = await partition_for(current_user["id"])
+    order = await get_cached_order(
+        partition, order_id, current_user["id"],
+        read_tokens(current_user["id"], x_causal_token),
+        # This process's own writes refresh the cache; a token from elsewhere must not be answered from it
+        refresh=written_elsewhere(current_user["id"], x_causal_token)
+    )
 
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    order["id"] = str(order.pop("_id"))
-    return OrderResponse(**order)
+    etag = order_etag(order)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return FastJSONResponse(serialize_document(order, OrderResponse), headers={"ETag": etag})
 
 
 @app.put("/orders/{order_id}", response_model=OrderResponse)
 async def update_order(
     order_id: str,
     order_update: OrderUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    if_match: Optional[str] = Header(None)
 ):
     """
-    Update order status or shipping address.
+    Update order status or shipping address in a single atomic operation.
+    A `version` in the body or an `If-Match` header makes the update conditional;
+    concurrent modifications and invalid status transitions are rejected with 409.
     """
-    database = await db.get_database()
+    partition = await partition_for(current_user["id"], write=True)
+    database = await partition.get_database()
 
-    # Get existing order
-    order = await database.orders.find_one({
-        "_id": ObjectId(order_id),
-        "user_id": current_user["id"]
-    })
+    update_data = order_update.model_dump(exclude_unset=True)
+    expected_version = update_data.pop("version", None)
+    if if_match is not None:
+        expected_version = parse_if_match(if_match)
 
-    if order is None:
-        raise HTTPException(status_code=404, detail="Order not found")
+    query = {"_id": ObjectId(order_id), "user_id": current_user["id"]}
+    if expected_version is not None:
+        query["version"] = version_filter(expected_version)
+    if update_data.get("status"):
+        query["status"] = transition_filter(update_data["status"])
 
-    # Update order
-    update_data = order_update.dict(exclude_unset=True)
     update_data["updated_at"] = datetime.now()
+    # The previous document is returned so the summary can move the status counters
+    async with partition.causal_session() as session:
+        order = await database.orders.find_one_and_update(
+            query,
+            {"$set": update_data, "$inc": {"version": 1}},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        token = partition.causal_token(session)
 
-    await database.orders.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": update_data}
+    if order is None:
+        # Drop a possibly stale cached copy before reporting the conflict
+        invalidate_order(order_id, current_user["id"])
+        # Only the failure path pays for a second read, to tell the caller why
+        order = await database.orders.find_one({"_id": ObjectId(order_id), "user_id": current_user["id"]})
+        if order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        new_status = update_data.get("status")
+        if new_status and not can_transition(order["status"], new_status):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Cannot change order status from {order['status']} to {new_status.value}"
+            )
+        raise HTTPException(status_code=409, detail="Order was modified concurrently")
+
+    updated_order = {**order, **update_data, "version": order.get("version", 0) + 1}
+    cache_order(updated_order)
+    headers = {"ETag": order_etag(updated_order), **remember_write(current_user["id"], token)}
+    if update_data.get("status"):
+        await record_status_change(
+            database, current_user["id"], order["status"], updated_order["status"], order["total_amount"]
+        )
+
+    return FastJSONResponse(
+        serialize_document(updated_order, OrderResponse),
+        headers=headers
     )
 
-    # Get updated order
-    updated_order = await database.orders.find_one({"_id": ObjectId(order_id)})
-    updated_order["id"] = str(updated_order.pop("_id"))
 
-    return OrderResponse(**updated_order)
+async def stream_orders(cursor, limit: Optional[int], fields: Optional[Set[str]]) -> AsyncIterator[bytes]:
+    """
+    Write orders as NDJSON as they come off the Mongo cursor. Headers are sent
+    before the page is read, so with `limit` the next page's cursor comes as a
+    final `{"next_cursor": ...}` line when there is one.
+    """
+    count = 0
+    last = None
+    async for order in cursor:
+        if limit and count >= limit:
+            yield dumps({"next_cursor": encode_cursor(last)}) + b"\n"
+            break
+        # Kept before select_fields takes the _id out
+        last = {"created_at": order["created_at"], "_id": order["_id"]}
+        if fields is None:
+            yield dumps(serialize_document(order, OrderResponse)) + b"\n"
+        else:
+            yield dumps(select_fields(order, fields)) + b"\n"
+        count += 1
 
 
 @app.get("/orders/", response_model=List[OrderResponse])
 async def list_orders(
     current_user: dict = Depends(get_current_user),
-    status: Optional[OrderStatus] = None
+    status: Optional[OrderStatus] = None,
+    limit: Optional[int] = Query(None, ge=1, le=settings.list_orders_max_limit),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    batch_size: int = Query(settings.list_orders_batch_size, ge=1, le=settings.list_orders_max_batch_size),
+    x_causal_token: Optional[str] = Header(None)
 ):
     """
-    List all orders for the current user, optionally filtered by status.
+    List orders for the current user, optionally filtered by status, oldest first.
+    With `limit`, the `X-Next-Cursor` response header holds the `after` value of the next page.
+    `fields` selects a comma separated subset of fields and `stream=true` streams NDJSON,
+    ending with a `{"next_cursor": ...}` line instead of the header.
+    An `X-Causal-Token` from an earlier write guarantees that write is listed.
     """
-    database = await db.get_database()
-
     # Build query
     query = {"user_id": current_user["id"]}
     if status:
         query["status"] = status
+    if after:
+        query.update(decode_cursor(after))
+
+    selected = parse_fields(fields)
+    tokens = read_tokens(current_user["id"], x_causal_token)
+    partition = await partition_for(current_user["id"])
+
+    def find(collection, session=None):
+        cursor = collection.find(query, projection_for(selected), session=session)
+        cursor = cursor.sort(ORDER_SORT).batch_size(batch_size)
+        if limit:
+            # One extra document tells whether there is a next page
+            cursor = cursor.limit(limit + 1)
+        return cursor
+
+    if stream:
+        # Rather than holding a session open while streaming, a listing right after a write reads the primary
+        collection = await partition.collection("orders", PRIMARY if tokens else LIST)
+        return StreamingResponse(stream_orders(find(collection), limit, selected), media_type="application/x-ndjson")
 
     # Fetch orders
-    orders = []
-    async for order in database.orders.find(query):
-        order["id"] = str(order.pop("_id"))
-        orders.append(OrderResponse(**order))
+    collection = await partition.collection("orders", LIST)
+    if tokens:
+        async with partition.causal_session(*tokens) as session:
+            orders = [order async for order in find(collection, session)]
+    else:
+        orders = [order async for order in find(collection)]
+    headers = {}
+    if limit and len(orders) > limit:
+        orders = orders[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(orders[-1])
+
+    if selected is not None:
+        return FastJSONResponse([select_fields(order, selected) for order in orders], headers=headers)
+    return FastJSONResponse([serialize_document(order, OrderResponse) for order in orders], headers=headers)
+
+
+@app.post(
+    "/admin/orders/summaries/recompute",
+    dependencies=[Depends(require_admin(settings.admin_api_key))]
+)
+async def recompute_order_summaries(user_id: Optional[str] = None):
+    """
+    Rebuild order summaries from the orders collection, for one user or for all users.
+    """
+    partitions = [await partition_for(user_id)] if user_id else db.partitions
+    rebuilt = 0
+    for partition in partitions:
+        rebuilt += await recompute_summaries(await partition.get_database(), user_id)
+    return APIResponse.success(message="Order summaries recomputed", data={"users": rebuilt})
+
+
+@app.get(
+    "/admin/orders/export",
+    dependencies=[Depends(require_admin(settings.admin_api_key))]
+)
+async def export_orders(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[OrderStatus] = None,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=settings.list_orders_max_batch_size)
+):
+    """
+    Stream all orders as NDJSON (MongoDB Extended JSON) in `_id` order,
+    optionally created in [since, until) and filtered by status or user.
+    Resume an interrupted export with `after` = the last exported `_id`.
+    Partitions are merged into one stream in `_id` order.
+    """
+    try:
+        query = export_query(since, until, after, status=status, user_id=user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    partitions = [await partition_for(user_id)] if user_id else db.partitions
+    collections = [await partition.collection("orders", LIST) for partition in partitions]
+    return StreamingResponse(
+        export_documents(collections, query, batch_size),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post(
+    "/admin/orders/import",
+    dependencies=[Depends(require_admin(settings.admin_api_key))]
+)
+async def import_orders(
+    request: Request,
+    chunk_size: int = Query(settings.import_chunk_size, ge=1, le=settings.bulk_orders_max_batch * 10),
+    concurrency: int = Query(settings.import_concurrency, ge=1, le=32)
+):
+    """
+    Bulk import orders from an NDJSON request body, read and written in chunks.
+    Orders already present (same `_id`) are counted as duplicates, so a
+    partly imported file can be sent again. Summaries are not updated:
+    call /admin/orders/summaries/recompute afterwards.
+    Each order goes to the partition of its `user_id`.
+    """
+    collections = [await partition.collection("orders") for partition in db.partitions]
+
+    async def route(order: dict) -> int:
+        if not isinstance(order.get("user_id"), str):
+            raise ValueError("order without a user_id")
+        return await db.partition_of(order["user_id"])
+
+    try:
+        summary = await import_documents(
+            collections, iter_lines(request.stream()), chunk_size, concurrency, route=route
+        )
+    except LineTooLong as e:
+        # Lines before it are imported; the file can be fixed and sent again
+        raise HTTPException(status_code=413, detail=str(e))
+    return APIResponse.success(message="Orders imported", data=summary.as_dict())
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit, miss and eviction counters of the in-process caches.
+    """
+    return {"token_cache": token_cache.stats(), "order_cache": order_cache.stats()}
+
+
+install_health(app, db, {"user_service": resilience_stats})
 
-    return orders
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=settings.service_port, reload=True)
+    # loop/http "auto" use uvloop and httptools when they are installed
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=settings.service_port,
+        reload=settings.reload,
+        workers=settings.workers,
+        loop="auto",
+        http="auto",
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout
+    )
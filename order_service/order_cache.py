@@ -0,0 +1,58 @@
+"""
+Read-through cache of order documents, keyed by order id and owner.
+Every write to an order must refresh or invalidate its entry.
+"""
+from typing import List, Optional
+
+from bson import ObjectId
+
+from config import settings
+from shared.utils.base_database import LOOKUP, BaseDatabase
+from shared.utils.cache import TTLCache
+
+order_cache = TTLCache(max_size=settings.order_cache_size, ttl=settings.order_cache_ttl)
+
+
+def _key(order_id: str, user_id: str):
+    return order_id, user_id
+
+
+def cache_order(order: dict):
+    """Store the current state of an order, replacing any entry or load in flight"""
+    key = _key(str(order["_id"]), order["user_id"])
+    order_cache.invalidate(key)
+    order_cache.set(key, order)
+
+
+def invalidate_order(order_id: str, user_id: str):
+    """Drop an order from the cache"""
+    order_cache.invalidate(_key(order_id, user_id))
+
+
+def _order_ttl(order: Optional[dict]) -> Optional[float]:
+    """Unknown orders are not cached"""
+    return None if order else 0
+
+
+async def get_cached_order(
+    partition: BaseDatabase, order_id: str, user_id: str, causal_tokens: List[str] = (), refresh: bool = False
+) -> Optional[dict]:
+    """
+    Read-through lookup of an order owned by `user_id` in the user's partition, with the lookup read preference.
+    Misses read in a causal session when the user has `causal_tokens`. `refresh`
+    drops the cached entry first, for a token from a write this process's cache
+    has not seen. Concurrent misses for the same order share one query. The
+    returned document is shared with the cache and must not be modified.
+    """
+    query = {"_id": ObjectId(order_id), "user_id": user_id}
+
+    async def load():
+        if not causal_tokens:
+            return await partition.find_one("orders", query, LOOKUP)
+        async with partition.causal_session(*causal_tokens) as session:
+            return await partition.find_one("orders", query, LOOKUP, session=session)
+
+    key = _key(order_id, user_id)
+    if refresh:
+        order_cache.invalidate(key)
+    return await order_cache.get_or_load(key, load, ttl=_order_ttl)
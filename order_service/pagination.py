@@ -0,0 +1,63 @@
+"""
+Keyset pagination and field projection helpers for order listings.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Set
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import ASCENDING
+
+from shared.models.order import OrderResponse
+
+# Listing order; the (created_at, _id) pair is unique and backs the cursor
+ORDER_SORT = [("created_at", ASCENDING), ("_id", ASCENDING)]
+
+
+def encode_cursor(order: dict) -> str:
+    """Build an opaque cursor pointing just after `order`"""
+    raw = json.dumps({"created_at": order["created_at"].isoformat(), "id": str(order["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Turn a cursor into a query matching the orders that come after it"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(raw["created_at"])
+        order_id = ObjectId(raw["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$gt": created_at}},
+        {"created_at": created_at, "_id": {"$gt": order_id}},
+    ]}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Parse a comma separated `fields` parameter into a set of OrderResponse fields"""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(OrderResponse.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def projection_for(fields: Optional[Set[str]]) -> Optional[dict]:
+    """Mongo projection for the requested fields, always keeping the cursor keys"""
+    if fields is None:
+        return None
+    projection = {field: 1 for field in fields if field != "id"}
+    projection["created_at"] = 1
+    return projection
+
+
+def select_fields(order: dict, fields: Set[str]) -> dict:
+    """Keep only the requested fields of a projected order"""
+    order["id"] = str(order.pop("_id"))
+    return {field: order[field] for field in fields if field in order}
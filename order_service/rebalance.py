@@ -0,0 +1,221 @@
+"""
+Move users' orders between partitions while the Order Service keeps serving.
+
+Run from the order_service directory with the services' ORDER_PARTITIONS:
+
+    python rebalance.py status
+    python rebalance.py move 64b7f0c2a1b2c3d4e5f60718 --to 2
+    python rebalance.py pin --current 2      # before adding a third partition
+    python rebalance.py rebalance            # after the rollout
+    python rebalance.py rebalance --scan     # also pick up strays found in any partition
+
+Moving a user: the orders are copied while writes continue in the source
+partition; then the user's route is set to "moving", which makes the service
+refuse the user's writes with 503 + Retry-After while reads continue; after
+`--grace` seconds (every worker has seen the route and in-flight writes are
+done) the orders are copied again, the summary is rebuilt in the target, the
+route is switched and, after another grace period for workers still reading
+the old route, the source copies are deleted. Copies are idempotent
+upserts, so an interrupted move is completed by running it again.
+
+Growing from N to N + 1 partitions: run `pin --current N` with the new
+ORDER_PARTITIONS before rolling it out. It pins every user whose home
+changes to where their orders are. After the rollout, `rebalance` moves the
+pinned users home one by one.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import AsyncIterator
+
+from pymongo import ReplaceOne
+
+from config import settings
+from database import db
+from shared.utils.base_database import BaseDatabase
+from shared.utils.partitioning import ACTIVE, MOVING, ROUTES
+from summaries import SUMMARIES, recompute_summaries
+
+
+async def owners(partition: BaseDatabase) -> AsyncIterator[str]:
+    """Users with orders in a partition"""
+    database = await partition.get_database()
+    async for group in database.orders.aggregate([{"$group": {"_id": "$user_id"}}], allowDiskUse=True):
+        yield group["_id"]
+
+
+async def copy_orders(source: BaseDatabase, target: BaseDatabase, user_id: str, batch_size: int) -> int:
+    """Upsert all orders of a user from `source` into `target`"""
+    source_orders = (await source.get_database()).orders
+    target_orders = (await target.get_database()).orders
+    copied = 0
+    batch = []
+    async for order in source_orders.find({"user_id": user_id}).batch_size(batch_size):
+        batch.append(ReplaceOne({"_id": order["_id"]}, order, upsert=True))
+        if len(batch) >= batch_size:
+            await target_orders.bulk_write(batch, ordered=False)
+            copied += len(batch)
+            batch = []
+    if batch:
+        await target_orders.bulk_write(batch, ordered=False)
+        copied += len(batch)
+    return copied
+
+
+async def delete_user(partition: BaseDatabase, user_id: str):
+    database = await partition.get_database()
+    await database.orders.delete_many({"user_id": user_id})
+    await database[SUMMARIES].delete_one({"_id": user_id})
+
+
+async def move(user_id: str, target: int, grace: float, batch_size: int) -> str:
+    """Move a user's orders and summary to partition `target`"""
+    route = await db.load_route(user_id)
+    current = db.home(user_id) if route is None else route["partition"]
+    if current == target:
+        if route is not None and target == db.home(user_id):
+            await db.clear_route(user_id)
+        elif route is not None and route.get("state") == MOVING:
+            # An interrupted move that never switched: let the writes in again
+            await db.set_route(user_id, current, ACTIVE)
+        return f"{user_id}: already in partition {target}"
+
+    source, destination = db.partitions[current], db.partitions[target]
+    # Pinned where it is, so the route can be switched whatever its home
+    await db.set_route(user_id, current, route.get("state", ACTIVE) if route else ACTIVE)
+    await copy_orders(source, destination, user_id, batch_size)
+
+    await db.set_route(user_id, current, MOVING)
+    start = time.perf_counter()
+    await asyncio.sleep(grace)
+    copied = await copy_orders(source, destination, user_id, batch_size)
+    await recompute_summaries(await destination.get_database(), user_id)
+
+    if target == db.home(user_id):
+        await db.clear_route(user_id)
+    else:
+        await db.set_route(user_id, target, ACTIVE)
+    frozen = time.perf_counter() - start
+    await asyncio.sleep(grace)
+    await delete_user(source, user_id)
+    return f"{user_id}: {copied} orders moved from partition {current} to {target} (writes paused {frozen:.1f}s)"
+
+
+async def merge_strays(user_id: str, stray: int, grace: float, batch_size: int) -> str:
+    """
+    Fold orders of a user found outside its current partition into it.
+    The stray partition gets none of the user's writes, so nothing is paused.
+    """
+    current = await db.partition_of(user_id)
+    destination = db.partitions[current]
+    copied = await copy_orders(db.partitions[stray], destination, user_id, batch_size)
+    await recompute_summaries(await destination.get_database(), user_id)
+    await asyncio.sleep(grace)
+    await delete_user(db.partitions[stray], user_id)
+    return f"{user_id}: {copied} stray orders merged from partition {stray} into {current}"
+
+
+async def status(args):
+    for index, partition in enumerate(db.partitions):
+        database = await partition.get_database()
+        count = await database.orders.estimated_document_count()
+        print(f"partition {index} {partition.database_name}: ~{count} orders")
+    routes = await db.directory.collection(ROUTES)
+    async for route in routes.find():
+        state = f" ({route['state']})" if route.get("state") != ACTIVE else ""
+        print(f"  {route['_id']} pinned to {route['partition']}{state}, home {db.home(route['_id'])}")
+
+
+async def pin(args):
+    """Pin every user whose home partition differs from where its orders are"""
+    if not 0 < args.current < len(db.partitions):
+        raise ValueError(f"--current must be between 1 and {len(db.partitions) - 1}")
+    pinned = 0
+    for index in range(args.current):
+        async for user_id in owners(db.partitions[index]):
+            if db.home(user_id) != index and await db.load_route(user_id) is None:
+                await db.set_route(user_id, index, ACTIVE)
+                pinned += 1
+    print(f"{pinned} users pinned")
+
+
+async def run_moves(jobs, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            try:
+                print(await job)
+            except Exception as e:
+                print(f"Failed: {e}")
+
+    await asyncio.gather(*(run(job) for job in jobs))
+
+
+async def rebalance(args):
+    """Move every pinned user home and, with --scan, merge stray orders"""
+    routes = await db.directory.collection(ROUTES)
+    user_ids = [route["_id"] async for route in routes.find({}, {"_id": 1})]
+    await run_moves(
+        (move(user_id, db.home(user_id), args.grace, args.batch_size) for user_id in user_ids),
+        args.concurrency
+    )
+    if args.scan:
+        strays = []
+        for index, partition in enumerate(db.partitions):
+            async for user_id in owners(partition):
+                if await db.partition_of(user_id) != index:
+                    strays.append((user_id, index))
+        await run_moves(
+            (merge_strays(user_id, index, args.grace, args.batch_size) for user_id, index in strays),
+            args.concurrency
+        )
+
+
+async def main(args):
+    # Routes are read fresh here, never from the per-process cache
+    db.routes.ttl = 0
+    for partition in db.partitions:
+        partition.warmup_connections = 1
+    await db.connect_db()
+    try:
+        if args.command == "move":
+            print(await move(args.user_id, args.to, args.grace, args.batch_size))
+        else:
+            await {"status": status, "pin": pin, "rebalance": rebalance}[args.command](args)
+    finally:
+        await db.close_db()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=("status", "move", "pin", "rebalance"))
+    parser.add_argument("user_id", nargs="?", help="user to move")
+    parser.add_argument("--to", type=int, help="target partition of a move")
+    parser.add_argument("--current", type=int, help="partition count before the rollout (pin)")
+    parser.add_argument("--scan", action="store_true", help="also merge orders found outside their partition")
+    parser.add_argument(
+        "--grace", type=float, default=settings.partition_routing_ttl + settings.request_timeout + 1,
+        help="seconds for workers to see a route change (routing TTL + request timeout)"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8, help="users moved at a time")
+    args = parser.parse_args()
+    if len(db.partitions) == 1:
+        parser.error("ORDER_PARTITIONS lists a single partition")
+    if args.command == "move" and (args.user_id is None or args.to is None):
+        parser.error("move requires a user_id and --to")
+    if args.command == "move" and not 0 <= args.to < len(db.partitions):
+        parser.error(f"--to must be between 0 and {len(db.partitions) - 1}")
+    if args.command == "pin" and args.current is None:
+        parser.error("pin requires --current")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,104 @@
+"""
+Incrementally maintained per-user order summaries.
+Each order write applies one atomic $inc/$max update to the owner's summary,
+so reading a summary is a single document lookup.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from shared.models.order import OrderStatus
+
+SUMMARIES = "order_summaries"
+
+
+def _spend(status: str, total_amount: float) -> float:
+    """Cancelled orders do not count towards lifetime spend"""
+    return 0.0 if status == OrderStatus.CANCELLED else total_amount
+
+
+async def record_created(database, user_id: str, orders: List[dict]):
+    """Account for newly created orders of one user"""
+    if not orders:
+        return
+    increments = {"total_orders": len(orders), "lifetime_spend": 0.0}
+    for order in orders:
+        key = f"counts.{OrderStatus(order['status']).value}"
+        increments[key] = increments.get(key, 0) + 1
+        increments["lifetime_spend"] += _spend(order["status"], order["total_amount"])
+
+    await database[SUMMARIES].update_one(
+        {"_id": user_id},
+        {
+            "$inc": increments,
+            "$max": {"last_order_at": max(order["created_at"] for order in orders)},
+            "$set": {"updated_at": datetime.now()},
+        },
+        upsert=True
+    )
+
+
+async def record_status_change(database, user_id: str, old_status: str, new_status: str, total_amount: float):
+    """Move one order between status counters"""
+    if old_status == new_status:
+        return
+    await database[SUMMARIES].update_one(
+        {"_id": user_id},
+        {
+            "$inc": {
+                f"counts.{OrderStatus(old_status).value}": -1,
+                f"counts.{OrderStatus(new_status).value}": 1,
+                "lifetime_spend": _spend(new_status, total_amount) - _spend(old_status, total_amount),
+            },
+            "$set": {"updated_at": datetime.now()},
+        },
+        upsert=True
+    )
+
+
+async def get_summary(database, user_id: str) -> Optional[dict]:
+    return await database[SUMMARIES].find_one({"_id": user_id})
+
+
+async def recompute_summaries(database, user_id: Optional[str] = None) -> int:
+    """
+    Rebuild summaries from the orders collection with an aggregation pipeline.
+    Groups arrive sorted by user, so only one user's totals are held at a time.
+    """
+    match = {"user_id": user_id} if user_id else {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "status": "$status"},
+            "count": {"$sum": 1},
+            "spend": {"$sum": "$total_amount"},
+            "last_order_at": {"$max": "$created_at"},
+        }},
+        {"$sort": {"_id.user_id": 1}},
+    ]
+
+    rebuilt = 0
+    current = None
+
+    async def flush(summary):
+        summary["updated_at"] = datetime.now()
+        await database[SUMMARIES].replace_one({"_id": summary["_id"]}, summary, upsert=True)
+
+    async for group in database.orders.aggregate(pipeline, allowDiskUse=True):
+        owner, status = group["_id"]["user_id"], group["_id"]["status"]
+        if current is None or current["_id"] != owner:
+            if current is not None:
+                await flush(current)
+                rebuilt += 1
+            current = {"_id": owner, "total_orders": 0, "counts": {}, "lifetime_spend": 0.0, "last_order_at": None}
+        current["total_orders"] += group["count"]
+        current["counts"][OrderStatus(status).value] = group["count"]
+        current["lifetime_spend"] += _spend(status, group["spend"])
+        if current["last_order_at"] is None or group["last_order_at"] > current["last_order_at"]:
+            current["last_order_at"] = group["last_order_at"]
+
+    if current is not None:
+        await flush(current)
+        rebuilt += 1
+    elif user_id:
+        await database[SUMMARIES].delete_one({"_id": user_id})
+    return rebuilt
@@ -1,23 +1,201 @@
 """
 Client for interacting with User Service.
 """
+import asyncio
+import hashlib
+import random
+import time
+from typing import Iterable, Optional
+
 import httpx
+from jose import JWTError, jwt
 from config import settings
 from fastapi import HTTPException
+from shared.utils.cache import TTLCache
+from shared.utils.metrics import outbound_request_duration
+from shared.utils.resilience import DEADLINE_HEADER, CircuitBreaker, CircuitOpen, RetryBudget, remaining_budget
 
+_client: Optional[httpx.AsyncClient] = None
 
-async def verify_user_token(token: str) -> dict:
+token_cache = TTLCache(max_size=settings.token_cache_size, ttl=settings.token_cache_ttl)
+breaker = CircuitBreaker(
+    "user_service",
+    failure_threshold=settings.user_service_breaker_threshold,
+    reset_timeout=settings.user_service_breaker_reset_timeout,
+    half_open_calls=settings.user_service_breaker_half_open_calls,
+)
+retry_budget = RetryBudget(ratio=settings.user_service_retry_ratio, max_tokens=settings.user_service_retry_max_tokens)
+
+# Only these mean the token itself was refused; anything else but 200 is the User Service's problem
+_REJECTED_STATUS = {401, 403}
+
+
+def create_client(**kwargs) -> httpx.AsyncClient:
+    """
+    Build a keep-alive client for the User Service.
+    HTTP/2 requires the optional `h2` package (pip install httpx[http2]).
+    """
+    return httpx.AsyncClient(
+        base_url=settings.user_service_url,
+        limits=httpx.Limits(
+            max_connections=settings.user_service_max_connections,
+            max_keepalive_connections=settings.user_service_max_keepalive,
+            keepalive_expiry=settings.user_service_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            settings.user_service_read_timeout,
+            connect=settings.user_service_connect_timeout,
+        ),
+        http2=settings.user_service_http2,
+        **kwargs
+    )
+
+
+async def start_client(**kwargs):
+    """Create the shared client, called once from the application lifespan"""
+    global _client
+    _client = create_client(**kwargs)
+
+
+async def close_client():
+    """Close the shared client and its connection pool"""
+    global _client
+    if _client:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get the shared client"""
+    if _client is None:
+        raise RuntimeError("User Service client is not started")
+    return _client
+
+
+async def _get_me(token: str, timeout: float) -> httpx.Response:
+    """One GET /users/me within `timeout` seconds, passing the budget on to the User Service"""
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            get_client().get(
+                "/users/me",
+                headers={"Authorization": f"Bearer {token}", DEADLINE_HEADER: str(int(timeout * 1000))},
+                timeout=httpx.Timeout(timeout, connect=min(timeout, settings.user_service_connect_timeout)),
+            ),
+            timeout
+        )
+    except (httpx.RequestError, asyncio.TimeoutError):
+        outbound_request_duration.observe(time.perf_counter() - start, "user_service", "error")
+        raise
+    outbound_request_duration.observe(time.perf_counter() - start, "user_service", str(response.status_code))
+    return response
+
+
+async def fetch_current_user(token: str) -> dict:
     """
     Verify user token with User Service.
+    Each attempt is bounded by the incoming request's remaining budget. Failed
+    attempts are retried while the retry budget allows, and the circuit breaker
+    fails fast with 503 while the User Service is unhealthy.
     """
-    async with httpx.AsyncClient() as client:
+    retry_budget.record_call()
+    attempt = 0
+    while True:
+        remaining = remaining_budget()
+        timeout = settings.user_service_read_timeout if remaining is None else min(settings.user_service_read_timeout, remaining)
+        if timeout <= 0:
+            raise HTTPException(status_code=503, detail="Request deadline exceeded")
         try:
-            response = await client.get(
-                f"{settings.user_service_url}/users/me",
-                headers={"Authorization": f"Bearer {token}"}
+            probe = breaker.before_call()
+        except CircuitOpen as e:
+            raise HTTPException(
+                status_code=503,
+                detail="User service unavailable",
+                headers={"Retry-After": str(max(1, int(e.retry_after + 0.5)))}
             )
-            if response.status_code == 200:
-                return response.json()
-            raise HTTPException(status_code=401, detail="Invalid token")
-        except httpx.RequestError:
+
+        recorded = False
+        try:
+            try:
+                response = await _get_me(token, timeout)
+            except (httpx.RequestError, asyncio.TimeoutError):
+                response = None
+            status = None if response is None else response.status_code
+            if status == 200 or status in _REJECTED_STATUS:
+                breaker.record_success()
+                recorded = True
+                if status == 200:
+                    return response.json()
+                raise HTTPException(status_code=401, detail="Invalid token")
+            if status is not None and status != 429 and status < 500:
+                # The User Service answered, but with nothing we can act on: neither retried nor cached
+                breaker.record_success()
+                recorded = True
+                raise HTTPException(status_code=503, detail="User service unavailable")
+            # Connection errors, timeouts, 429 from its admission control and 5xx
+            breaker.record_failure()
+            recorded = True
+        finally:
+            if probe and not recorded:
+                breaker.release_probe()
+
+        # GET /users/me is idempotent, so every failed attempt may be retried
+        attempt += 1
+        if attempt > settings.user_service_max_retries or not retry_budget.try_retry():
             raise HTTPException(status_code=503, detail="User service unavailable")
+        # Jittered backoff so retries from concurrent requests do not arrive together
+        await asyncio.sleep(settings.user_service_retry_backoff * attempt * random.uniform(0.5, 1.5))
+
+
+def resilience_stats() -> dict:
+    """Circuit breaker and retry budget state, for /health"""
+    return {"circuit_breaker": breaker.stats(), "retry_budget": retry_budget.stats()}
+
+
+def resilience_metric_lines() -> Iterable[str]:
+    """Exposition lines for REGISTRY.collector"""
+    yield from breaker.metric_lines()
+    yield "# TYPE retry_budget_retries_total counter"
+    yield f'retry_budget_retries_total{{target="user_service"}} {retry_budget.retries}'
+    yield "# TYPE retry_budget_exhausted_total counter"
+    yield f'retry_budget_exhausted_total{{target="user_service"}} {retry_budget.exhausted}'
+
+
+class _Rejected:
+    """Cached marker for a token the User Service refused"""
+
+    def __init__(self, exc: HTTPException):
+        self.exc = exc
+
+
+def _token_ttl(token: str, value) -> float:
+    """Keep rejections briefly and never keep a user past the token's `exp`"""
+    if isinstance(value, _Rejected):
+        return settings.token_cache_negative_ttl
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        exp = None
+    if exp is None:
+        return settings.token_cache_ttl
+    return min(settings.token_cache_ttl, float(exp) - time.time())
+
+
+async def verify_user_token(token: str) -> dict:
+    """
+    Verify user token, served from the token cache when possible.
+    Concurrent calls with the same uncached token share one User Service call.
+    """
+    async def load():
+        try:
+            return await fetch_current_user(token)
+        except HTTPException as exc:
+            if exc.status_code == 401:
+                return _Rejected(exc)
+            raise
+
+    key = hashlib.sha256(token.encode()).hexdigest()
+    result = await token_cache.get_or_load(key, load, ttl=lambda value: _token_ttl(token, value))
+    if isinstance(result, _Rejected):
+        raise result.exc
+    return result
@@ -1,12 +1,36 @@
 """
-script to run MongoDB and microservices simultaneously using multiprocessing.
+script to run MongoDB and microservices simultaneously.
+
+Two modes:
+- dev (default): one auto-reloading process per service.
+- prod: a supervisor owning each service's listening socket and running
+  several uvicorn worker processes on it. Crashed workers are restarted
+  with exponential backoff and shutdown drains connections gracefully.
+
+In both modes startup is gated on readiness probes (a MongoDB ping and each
+service's /health endpoint) instead of fixed sleeps, and the time from
+start to first ready is reported.
 """
+import argparse
+import os
+import platform
+import signal
+import socket
 import subprocess
 import sys
 import time
-import os
-from multiprocessing import Process
-import platform
+import urllib.error
+import urllib.request
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+
+SERVICES = [
+    # name, directory, port
+    ("User Service", "user_service", 8000),
+    ("Order Service", "order_service", 8001),
+]
 
 
 def is_mongodb_running():
@@ -31,10 +55,7 @@ def start_mongodb():
             os.makedirs(data_dir, exist_ok=True)
 
             print("Starting MongoDB...")
-            if platform.system() == "Windows":
-                return subprocess.Popen(["mongod", "--dbpath", data_dir])
-            else:
-                return subprocess.Popen(["mongod", "--dbpath", data_dir])
+            return subprocess.Popen(["mongod", "--dbpath", data_dir])
         else:
             print("MongoDB is already running")
             return None
@@ -46,98 +67,254 @@ def start_mongodb():
         sys.exit(1)
 
 
-def setup_pythonpath():
-    """Add shared directory to PYTHONPATH"""
-    shared_path = os.path.join(os.getcwd(), "shared")
-    if os.path.exists(shared_path):
-        os.environ["PYTHONPATH"] = f"{shared_path}{os.pathsep}{os.environ.get('PYTHONPATH', '')}"
+def service_env() -> dict:
+    """Environment for the services: the repository root on PYTHONPATH so `shared` imports"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+class StopRequested(Exception):
+    """SIGINT/SIGTERM arrived while waiting for a readiness probe"""
 
 
-def run_service(command):
-    """Run a service using the specified command"""
+def wait_until(probe, timeout: float, stopping=lambda: False, interval: float = 0.1) -> Optional[float]:
+    """
+    Poll `probe` until it returns True; return the time it took or None on timeout.
+    Raises StopRequested as soon as `stopping()` is true.
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if stopping():
+            raise StopRequested()
+        if probe():
+            return time.perf_counter() - start
+        time.sleep(interval)
+    return None
+
+
+def mongodb_ready() -> bool:
+    """Ping MongoDB, or check its port when pymongo is not importable here"""
     try:
-        setup_pythonpath()
-        subprocess.run(command, shell=True, check=True, env=os.environ)
-    except subprocess.CalledProcessError as e:
-        print(f"Service failed to start: {e}")
-    except KeyboardInterrupt:
-        pass
+        from pymongo import MongoClient
+    except ImportError:
+        host, _, port = MONGODB_URL.split("://", 1)[-1].split("/", 1)[0].partition(":")
+        try:
+            with socket.create_connection((host or "localhost", int(port or 27017)), timeout=0.5):
+                return True
+        except OSError:
+            return False
 
+    client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+        return True
+    except Exception:
+        return False
+    finally:
+        client.close()
 
-def main():
-    # Store process references
-    processes = []
 
+def service_ready(port: int) -> bool:
+    """Probe the service's /health endpoint"""
     try:
-        # Start MongoDB first
-        mongodb_process = start_mongodb()
-        if mongodb_process:
-            processes.append(mongodb_process)
-            # Wait for MongoDB to start
-            time.sleep(5)
-
-        # Create virtual environment and install dependencies if needed
-        if not os.path.exists("venv"):
-            print("Creating virtual environment...")
-            subprocess.run("python -m venv venv", shell=True, check=True)
-            
-            # Install requirements
-            if platform.system() == "Windows":
-                pip_cmd = ".\\venv\\Scripts\\pip"
-            else:
-                pip_cmd = "./venv/bin/pip"
-                
-            subprocess.run(f"{pip_cmd} install -r requirements.txt", shell=True, check=True)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+class Worker:
+    """One uvicorn process, restarted with exponential backoff when it dies"""
+
+    def __init__(self, command: List[str], cwd: str, pass_fds=()):
+        self.command = command
+        self.cwd = cwd
+        self.pass_fds = pass_fds
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.backoff = 1.0
+        self.restart_at: Optional[float] = None
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=service_env(), pass_fds=self.pass_fds)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+
+    def check(self, max_backoff: float):
+        """Restart the worker if it exited, waiting longer after each quick crash"""
+        now = time.monotonic()
+        if self.restart_at is not None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        if self.process.poll() is None:
+            if now - self.started_at > 60:
+                self.backoff = 1.0
+            return
+        print(f"Worker {self.process.pid} exited with {self.process.returncode}, restarting in {self.backoff:.0f}s")
+        self.restart_at = now + self.backoff
+        self.backoff = min(self.backoff * 2, max_backoff)
+
+    def terminate(self):
+        if self.process and self.process.poll() is None:
+            # SIGTERM on POSIX: uvicorn stops accepting and drains in-flight requests
+            self.process.terminate()
+
+    def wait(self, deadline: float):
+        if not self.process:
+            return
+        try:
+            self.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
 
-        # Determine Python path based on platform
+
+class Service:
+    def __init__(self, name: str, directory: str, port: int, args):
+        self.name = name
+        self.directory = os.path.join(ROOT, directory)
+        self.port = port
+        self.args = args
+        self.workers: List[Worker] = []
+        self.socket: Optional[socket.socket] = None
+
+    def uvicorn_command(self, *extra: str) -> List[str]:
+        return [
+            self.args.python, "-m", "uvicorn", "main:app",
+            # auto picks uvloop/httptools when they are installed
+            "--loop", "auto", "--http", "auto",
+            "--timeout-graceful-shutdown", str(self.args.graceful_timeout),
+            *extra,
+        ]
+
+    def start(self):
+        if self.args.mode == "dev":
+            self.workers = [Worker(self.uvicorn_command("--host", "0.0.0.0", "--port", str(self.port), "--reload"),
+                                   self.directory)]
+        elif platform.system() == "Windows":
+            # No socket inheritance: let uvicorn manage its own workers
+            self.workers = [Worker(self.uvicorn_command("--host", "0.0.0.0", "--port", str(self.port),
+                                                        "--workers", str(self.args.workers)), self.directory)]
+        else:
+            # The supervisor owns the socket so a restarted worker rebinds nothing
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(("0.0.0.0", self.port))
+            self.socket.listen(2048)
+            self.socket.set_inheritable(True)
+            fd = self.socket.fileno()
+            self.workers = [Worker(self.uvicorn_command("--fd", str(fd)), self.directory, pass_fds=(fd,))
+                            for _ in range(self.args.workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def check(self):
+        for worker in self.workers:
+            worker.check(self.args.max_backoff)
+
+    def terminate(self):
+        for worker in self.workers:
+            worker.terminate()
+
+    def wait(self, deadline: float):
+        for worker in self.workers:
+            worker.wait(deadline)
+        if self.socket:
+            self.socket.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run MongoDB and the microservices")
+    parser.add_argument("--mode", choices=("dev", "prod"), default="dev")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="worker processes per service (prod)")
+    parser.add_argument("--ready-timeout", type=float, default=60.0, help="seconds to wait for each readiness probe")
+    parser.add_argument("--graceful-timeout", type=int, default=20, help="seconds to drain connections on shutdown")
+    parser.add_argument("--max-backoff", type=float, default=30.0, help="longest delay between worker restarts")
+    return parser.parse_args()
+
+
+def ensure_venv() -> str:
+    """Create virtual environment and install dependencies if needed; return its python"""
+    if not os.path.exists("venv"):
+        print("Creating virtual environment...")
+        subprocess.run([sys.executable, "-m", "venv", "venv"], check=True)
+
+        # Install requirements
         if platform.system() == "Windows":
-            python_path = ".\\venv\\Scripts\\python"
+            pip_cmd = os.path.join("venv", "Scripts", "pip")
         else:
-            python_path = "./venv/bin/python"
+            pip_cmd = os.path.join("venv", "bin", "pip")
 
-        # Commands to run services
-        services = [
-            f"{python_path} user_service/main.py",
-            f"{python_path} order_service/main.py"
-        ]
+        subprocess.run([pip_cmd, "install", "-r", "requirements.txt"], check=True)
+
+    if platform.system() == "Windows":
+        return os.path.abspath(os.path.join("venv", "Scripts", "python"))
+    return os.path.abspath(os.path.join("venv", "bin", "python"))
 
-        # Start each service in a separate process
-        for service in services:
-            process = Process(target=run_service, args=(service,))
-            process.start()
-            processes.append(process)
-            time.sleep(2)  # Give each service time to start
 
-        print("\nAll services are running!")
+def main():
+    args = parse_args()
+    mongodb_process = None
+    services: List[Service] = []
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    try:
+        args.python = ensure_venv()
+        startup = time.perf_counter()
+
+        # Start MongoDB first
+        mongodb_process = start_mongodb()
+        waited = wait_until(mongodb_ready, args.ready_timeout, lambda: stopping)
+        if waited is None:
+            raise RuntimeError(f"MongoDB not ready after {args.ready_timeout:.0f}s")
+        print(f"MongoDB ready in {waited:.2f}s")
+
+        # Start services in dependency order, each gated on its health endpoint
+        for name, directory, port in SERVICES:
+            service = Service(name, directory, port, args)
+            service.start()
+            services.append(service)
+            waited = wait_until(lambda: service_ready(port), args.ready_timeout, lambda: stopping)
+            if waited is None:
+                raise RuntimeError(f"{name} not ready after {args.ready_timeout:.0f}s")
+            print(f"{name} ready in {waited:.2f}s ({len(service.workers)} process(es), {args.mode} mode)")
+
+        print(f"\nAll services are running! Startup to first ready: {time.perf_counter() - startup:.2f}s")
         print("MongoDB: localhost:27017")
         print("User Service: http://localhost:8000")
         print("Order Service: http://localhost:8001")
 
-        # Wait for all processes to complete
-        for process in processes:
-            if isinstance(process, Process):
-                process.join()
-            elif isinstance(process, subprocess.Popen):
-                process.wait()
+        while not stopping:
+            for service in services:
+                service.check()
+            time.sleep(0.5)
 
-    except KeyboardInterrupt:
-        print("\nStopping all services...")
+    except StopRequested:
+        print("\nInterrupted during startup")
     except Exception as e:
         print(f"\nAn error occurred: {e}")
     finally:
-        # Cleanup processes
-        for process in processes:
-            if isinstance(process, subprocess.Popen):
-                # For MongoDB process
-                if platform.system() == "Windows":
-                    subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)])
-                else:
-                    process.terminate()
-                    process.wait()
+        print("\nStopping all services...")
+        # Drain in reverse dependency order: stop taking orders before users
+        for service in reversed(services):
+            service.terminate()
+            service.wait(time.monotonic() + args.graceful_timeout + 5)
+
+        if mongodb_process:
+            if platform.system() == "Windows":
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(mongodb_process.pid)])
             else:
-                # For service processes
-                process.terminate()
-                process.join()
+                mongodb_process.terminate()
+                mongodb_process.wait()
 
         print("All services stopped")
 
@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Dict, Optional, List
 from shared.models.base import BaseModelWithConfig
 from pydantic import BaseModel, Field
 
@@ -12,6 +12,15 @@ class OrderStatus(str, Enum):
     DELIVERED = "delivered"
 
 
+# Status changes an order may go through; cancelled and delivered are terminal
+ORDER_STATUS_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.DELIVERED, OrderStatus.CANCELLED},
+    OrderStatus.CANCELLED: set(),
+    OrderStatus.DELIVERED: set(),
+}
+
+
 class OrderItem(BaseModelWithConfig):
     product_id: str
     quantity: int = Field(gt=0)
@@ -32,6 +41,8 @@ class OrderCreate(BaseModel):
 class OrderUpdate(BaseModelWithConfig):
     status: Optional[OrderStatus] = None
     shipping_address: Optional[str] = None
+    # Expected current version; the update is rejected with 409 if the order changed
+    version: Optional[int] = None
 
 
 class OrderResponse(OrderBase):
@@ -40,3 +51,26 @@ class OrderResponse(OrderBase):
     total_amount: float
     created_at: datetime
     updated_at: datetime
+    # Incremented on every update; orders written before versioning report 0
+    version: int = 0
+
+
+class BulkOrderResult(BaseModel):
+    index: int
+    success: bool
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkOrderResponse(BaseModel):
+    inserted: int
+    failed: int
+    results: List[BulkOrderResult]
+
+
+class OrderSummary(BaseModel):
+    user_id: str
+    total_orders: int = 0
+    counts: Dict[str, int] = Field(default_factory=dict)
+    lifetime_spend: float = 0.0
+    last_order_at: Optional[datetime] = None
@@ -1,4 +1,5 @@
-from pydantic import EmailStr
+from typing import Dict, List
+from pydantic import BaseModel, EmailStr
 from shared.models.base import BaseModelWithConfig, TimestampedModel
 from datetime import datetime
 
@@ -20,3 +21,13 @@ class UserInDB(UserBase, TimestampedModel):
 class UserResponse(UserBase):
     id: str
     created_at: datetime
+
+
+class UserBatchRequest(BaseModel):
+    ids: List[str]
+
+
+class UserBatchResponse(BaseModel):
+    users: Dict[str, UserResponse]
+    not_found: List[str]
+    invalid: List[str]
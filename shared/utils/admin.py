@@ -0,0 +1,19 @@
+"""
+Authorization for admin-only endpoints.
+"""
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+def require_admin(api_key: Optional[str]):
+    """
+    Dependency factory checking the `X-Admin-Key` header against the configured key.
+    Admin endpoints are disabled when no key is configured.
+    """
+    async def dependency(x_admin_key: Optional[str] = Header(None)):
+        if not api_key or not x_admin_key or not hmac.compare_digest(x_admin_key, api_key):
+            raise HTTPException(status_code=403, detail="Admin access required")
+
+    return dependency
@@ -0,0 +1,203 @@
+"""
+Admission control and load shedding.
+
+Requests are admitted per route up to a concurrency cap; a bounded FIFO queue
+absorbs short bursts and a request that waits longer than the queue-time
+budget (or its own deadline) is rejected with 503. Each client (bearer token,
+else address) also draws from a token bucket and is rejected with 429 once it
+is empty. Both rejections carry `Retry-After`, so overload costs a fast
+failure instead of a slow timeout for everyone.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from fastapi import FastAPI
+
+from shared.utils.metrics import REGISTRY, _route_of
+from shared.utils.resilience import remaining_budget
+from shared.utils.responses import APIResponse
+
+EXEMPT_PATHS = ("/health", "/metrics")
+
+admission_rejected = REGISTRY.counter(
+    "admission_rejected_total", "Requests shed by admission control", ("route", "reason")
+)
+admission_queue_wait = REGISTRY.histogram(
+    "admission_queue_wait_seconds", "Time admitted requests waited for a route slot", ("route",)
+)
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteLimiter:
+    """At most `limit` requests in flight, `max_queue` waiting, each waiting at most `timeout` seconds"""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: Optional[float] = None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected(503, "queue_full", self.timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), max(0.0, timeout))
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the budget ran out: use it
+                return
+            waiter.cancel()
+            raise Rejected(503, "queue_timeout", self.timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; return 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def parse_route_limits(value: str) -> Dict[str, int]:
+    """Parse `METHOD /path/{param}=limit,...` into per-route concurrency caps"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, limit = item.rpartition("=")
+        limits[route.strip()] = int(limit)
+    return limits
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying per-route concurrency caps and per-client token buckets"""
+
+    def __init__(self, app, max_concurrency: int = 0, route_limits: Optional[Dict[str, int]] = None,
+                 max_queue: int = 100, queue_timeout: float = 0.2, client_rate: float = 0.0,
+                 client_burst: float = 20.0, max_clients: int = 10000):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.route_limits = route_limits or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self._routes: Dict[str, Optional[RouteLimiter]] = {}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _limiter(self, key: str) -> Optional[RouteLimiter]:
+        if key not in self._routes:
+            limit = self.route_limits.get(key, self.max_concurrency)
+            self._routes[key] = RouteLimiter(limit, self.max_queue, self.queue_timeout) if limit > 0 else None
+        return self._routes[key]
+
+    @staticmethod
+    def _client_of(scope) -> str:
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                return hashlib.sha256(value).hexdigest()
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def _check_rate(self, scope):
+        if self.client_rate <= 0:
+            return
+        client = self._client_of(scope)
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.client_rate, self.client_burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.take()
+        if wait:
+            raise Rejected(429, "rate_limited", wait)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        route = _route_of(scope)
+        if route == "unmatched":
+            return await self.app(scope, receive, send)
+        key = f"{scope['method']} {route}"
+        limiter = self._limiter(key)
+
+        try:
+            self._check_rate(scope)
+            if limiter is not None:
+                start = time.perf_counter()
+                # Never queue past the request's own deadline
+                await limiter.acquire(remaining_budget())
+                admission_queue_wait.observe(time.perf_counter() - start, route)
+        except Rejected as e:
+            admission_rejected.inc(route, e.reason)
+            message = "Too many requests" if e.status_code == 429 else "Service overloaded, retry later"
+            response = APIResponse.error(message=message, status_code=e.status_code)
+            response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+            return await response(scope, receive, send)
+
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def install_admission(app: FastAPI, settings):
+    """Install admission control on `app` with the limits from a service's Settings"""
+    app.add_middleware(
+        AdmissionMiddleware,
+        max_concurrency=settings.admission_max_concurrency,
+        route_limits=parse_route_limits(settings.admission_route_limits),
+        max_queue=settings.admission_max_queue,
+        queue_timeout=settings.admission_queue_timeout_ms / 1000,
+        client_rate=settings.admission_client_rate,
+        client_burst=settings.admission_client_burst,
+    )
@@ -1,20 +1,199 @@
 """
-Database connection management for Order Service.
+Database connection management shared by the services.
 """
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import bson
+from bson.errors import InvalidBSON
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, monitoring, read_preferences
+from pymongo.errors import OperationFailure
+
+# Operation classes whose read preference can be configured; anything else reads from the primary
+LOOKUP = "lookup"
+LIST = "list"
+PRIMARY = "primary"
+
+_READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def read_preference(mode: str, max_staleness: int = -1):
+    """pymongo read preference for a mode name, with max staleness (seconds, -1 = none) on non-primary modes"""
+    if mode not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return read_preferences.Primary()
+    return _READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+def derived_key(secret: str, purpose: str) -> str:
+    """A key for `purpose` derived from `secret`, so one secret never signs two kinds of data"""
+    return hmac.new(secret.encode(), purpose.encode(), hashlib.sha256).hexdigest()
+
+
+def read_mongo_settings(settings):
+    """Set the MongoDB client settings shared by the services on a service's Settings, from the environment"""
+    # Connection pool, wire compression and default read/write concerns
+    settings.mongo_max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    settings.mongo_min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+    settings.mongo_max_idle_time_ms = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    settings.mongo_wait_queue_timeout_ms = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+    # Comma separated, e.g. "zstd,snappy,zlib"; empty disables compression
+    settings.mongo_compressors = os.getenv("MONGO_COMPRESSORS", "")
+    settings.mongo_read_concern = os.getenv("MONGO_READ_CONCERN", "")
+    # "majority", a node count or empty for the server default
+    settings.mongo_write_concern = os.getenv("MONGO_WRITE_CONCERN", "")
+    journal = os.getenv("MONGO_JOURNAL")
+    settings.mongo_journal = None if journal is None else journal.lower() == "true"
+    # Pooled connections opened with pings at startup
+    settings.mongo_warmup_connections = int(os.getenv("MONGO_WARMUP_CONNECTIONS", "10"))
+    # Read preference of lookups and listings: primary, primaryPreferred, secondary,
+    # secondaryPreferred or nearest; max staleness in seconds (>= 90, -1 = no bound)
+    settings.mongo_read_preference_lookup = os.getenv("MONGO_READ_PREFERENCE_LOOKUP", "primary")
+    settings.mongo_read_preference_list = os.getenv("MONGO_READ_PREFERENCE_LIST", "primary")
+    settings.mongo_max_staleness_seconds = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "-1"))
+
+
+def client_options_from(settings) -> Dict[str, Any]:
+    """AsyncIOMotorClient pool, compression and concern options from a service's Settings"""
+    options: Dict[str, Any] = {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": settings.mongo_max_idle_time_ms,
+        "waitQueueTimeoutMS": settings.mongo_wait_queue_timeout_ms,
+    }
+    if settings.mongo_compressors:
+        options["compressors"] = settings.mongo_compressors
+    if settings.mongo_read_concern:
+        options["readConcernLevel"] = settings.mongo_read_concern
+    if settings.mongo_write_concern:
+        options["w"] = int(settings.mongo_write_concern) if settings.mongo_write_concern.isdigit() else settings.mongo_write_concern
+    if settings.mongo_journal is not None:
+        options["journal"] = settings.mongo_journal
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage from pymongo pool events (called from driver threads)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open=-1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._add(in_use=-1)
+
+    def snapshot(self, max_pool_size: Optional[int]) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "open": self.open,
+                "in_use": self.in_use,
+                "idle": max(0, self.open - self.in_use),
+                "waiting": self.waiting,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+        stats["max_pool_size"] = max_pool_size
+        stats["utilisation"] = round(self.in_use / max_pool_size, 4) if max_pool_size else None
+        return stats
 
 
 class BaseDatabase:
-    def __init__(self, mongodb_url: str, database_name: str):
+    # Indexes each service requires, by collection name
+    indexes: Dict[str, List[IndexModel]] = {}
+
+    def __init__(self, mongodb_url: str, database_name: str, client_factory=AsyncIOMotorClient,
+                 client_options: Optional[Dict[str, Any]] = None, warmup_connections: int = 0,
+                 read_preferences: Optional[Dict[str, str]] = None, max_staleness: int = -1,
+                 causal_token_key: str = ""):
         self.mongodb_url = mongodb_url
         self.database_name = database_name
+        # Swappable so benchmarks can inject an in-memory stand-in
+        self.client_factory = client_factory
+        # Extra AsyncIOMotorClient keyword arguments, e.g. pool options and event_listeners
+        self.client_options: Dict[str, Any] = dict(client_options or {})
+        self.warmup_connections = warmup_connections
+        self.pool_monitor = PoolMonitor()
+        # Read preference per operation class, e.g. {"lookup": "secondaryPreferred"}
+        self.read_preferences = {
+            operation: read_preference(mode, max_staleness)
+            for operation, mode in (read_preferences or {}).items()
+        }
+        # Signs the causal tokens handed to clients so they cannot forge cluster times
+        self.causal_token_key = causal_token_key.encode()
         self.client: AsyncIOMotorClient = None
 
     async def connect_db(self):
-        """Establish connection to MongoDB"""
-        self.client = AsyncIOMotorClient(self.mongodb_url)
+        """Establish connection to MongoDB and warm up the connection pool"""
+        options = dict(self.client_options)
+        options["event_listeners"] = [*options.get("event_listeners", []), self.pool_monitor]
+        self.client = self.client_factory(self.mongodb_url, **options)
+        await self.warm_up(self.warmup_connections)
 
-    def close_db(self):
+    async def warm_up(self, connections: int):
+        """
+        Open `connections` pooled connections with concurrent pings, so the first
+        requests do not pay for server discovery and connection setup.
+        Fails if the server is unreachable.
+        """
+        start = time.perf_counter()
+        await asyncio.gather(*(self.client.admin.command("ping") for _ in range(max(1, connections))))
+        print(f"MongoDB reachable, {max(1, connections)} connection(s) warmed in {time.perf_counter() - start:.3f}s")
+
+    async def close_db(self):
         """Close MongoDB connection"""
         if self.client:
             self.client.close()
@@ -22,3 +201,110 @@ class BaseDatabase:
     async def get_database(self):
         """Get database instance"""
         return self.client[self.database_name]
+
+    def reads_from_primary(self, operation: str) -> bool:
+        preference = self.read_preferences.get(operation)
+        return preference is None or isinstance(preference, read_preferences.Primary)
+
+    async def collection(self, name: str, operation: str = PRIMARY):
+        """Collection `name` with the read preference configured for `operation`"""
+        database = await self.get_database()
+        preference = self.read_preferences.get(operation)
+        if preference is None:
+            return database[name]
+        return database.get_collection(name, read_preference=preference)
+
+    async def find_one(self, name: str, query: dict, operation: str = PRIMARY, session=None, **kwargs):
+        """
+        find_one with the read preference of `operation`. A miss on a secondary is
+        retried on the primary, since a lagging secondary may not have the document yet.
+        """
+        collection = await self.collection(name, operation)
+        document = await collection.find_one(query, session=session, **kwargs)
+        if document is None and not self.reads_from_primary(operation):
+            document = await (await self.collection(name)).find_one(query, session=session, **kwargs)
+        return document
+
+    @asynccontextmanager
+    async def causal_session(self, *tokens: str) -> AsyncIterator[Any]:
+        """
+        Causally consistent session. Reads in it, even from secondaries, see every
+        write made in it and every write up to the points recorded in `tokens`.
+        """
+        async with await self.client.start_session(causal_consistency=True) as session:
+            for token in tokens:
+                times = self._decode_causal_token(token)
+                if times:
+                    session.advance_cluster_time(times["cluster_time"])
+                    session.advance_operation_time(times["operation_time"])
+            yield session
+
+    def causal_token(self, session) -> Optional[str]:
+        """Opaque, signed token of the point a session has reached, for later reads"""
+        if session.cluster_time is None or session.operation_time is None:
+            return None
+        payload = bson.encode({"cluster_time": session.cluster_time, "operation_time": session.operation_time})
+        signature = hmac.new(self.causal_token_key, payload, hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(signature + payload).decode()
+
+    def _decode_causal_token(self, token: str) -> Optional[dict]:
+        """The cluster and operation time in a token; None for a malformed or forged one"""
+        try:
+            raw = base64.urlsafe_b64decode(token.encode())
+        except (ValueError, TypeError):
+            return None
+        signature, payload = raw[:16], raw[16:]
+        expected = hmac.new(self.causal_token_key, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            return None
+        try:
+            return bson.decode(payload)
+        except InvalidBSON:
+            return None
+
+    async def ping(self, timeout: float = 2.0) -> float:
+        """Round trip a ping to the server and return its latency in seconds"""
+        start = time.perf_counter()
+        await asyncio.wait_for(self.client.admin.command("ping"), timeout)
+        return time.perf_counter() - start
+
+    async def health(self) -> Dict[str, Any]:
+        """Ping latency and connection pool utilisation"""
+        latency = await self.ping()
+        return {
+            "ping_ms": round(latency * 1000, 3),
+            "pool": self.pool_monitor.snapshot(self.client_options.get("maxPoolSize", 100)),
+        }
+
+    async def ensure_indexes(self):
+        """
+        Create the declared indexes (a no-op for those that already exist)
+        and report any drift between the declared and the existing indexes.
+        Raises RuntimeError when a declared unique index is not in place, since
+        writes rely on it to reject duplicates.
+        """
+        database = await self.get_database()
+        missing_unique = []
+        for collection_name, models in self.indexes.items():
+            collection = database[collection_name]
+            target = f"{self.database_name}.{collection_name}"
+            try:
+                await collection.create_indexes(models)
+            except OperationFailure as e:
+                print(f"Index drift on {target}: could not create declared indexes: {e}")
+
+            existing = await collection.index_information()
+            declared = {model.document["name"]: model.document for model in models}
+            for name, spec in declared.items():
+                info = existing.get(name)
+                if info is None:
+                    print(f"Index drift on {target}: declared index {name} is missing")
+                elif list(info["key"]) != list(spec["key"].items()) or info.get("unique", False) != spec.get("unique", False):
+                    print(f"Index drift on {target}: index {name} differs from its declaration")
+                if spec.get("unique") and (info is None or not info.get("unique") or list(info["key"]) != list(spec["key"].items())):
+                    missing_unique.append(f"{target}.{name}")
+            for name, info in existing.items():
+                if name != "_id_" and name not in declared:
+                    print(f"Index drift on {target}: undeclared index {name} on {info['key']}")
+        if missing_unique:
+            raise RuntimeError(f"Unique indexes could not be built: {', '.join(missing_unique)}")
@@ -0,0 +1,110 @@
+"""
+Bounded in-process TTL/LRU cache with single-flight loading.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
+
+_MISSING = object()
+
+Loader = Callable[[], Awaitable[Any]]
+TTL = Union[None, float, Callable[[Any], Optional[float]]]
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire after a per-entry TTL.
+    Concurrent `get_or_load` calls for the same missing key share one loader call.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a live entry and mark it as recently used"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store an entry; the TTL is capped by the cache TTL and non-positive TTLs are not stored"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop an entry if present; a load already in flight for it will not be stored"""
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._inflight.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Loader, ttl: TTL = None) -> Any:
+        """
+        Return the cached value or load it once for all concurrent callers.
+        `ttl` may be a callable that computes the TTL from the loaded value.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the load for the others
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Loader, ttl: TTL) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+            # A write that invalidated the key while loading makes this value stale
+            if self._inflight.get(key) is task:
+                self.set(key, value, ttl(value) if callable(ttl) else ttl)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        """Counters used to size the cache"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+        }
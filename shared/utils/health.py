@@ -0,0 +1,27 @@
+"""
+Readiness endpoint shared by the services.
+"""
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import FastAPI, HTTPException
+from pymongo.errors import PyMongoError
+
+
+def install_health(app: FastAPI, database, details: Optional[Dict[str, Callable[[], Any]]] = None):
+    """
+    Serve /health on `app`: the service is up and MongoDB (every partition of a
+    partitioned database) answers a ping. Reports the ping latency and
+    connection pool utilisation, plus each of `details`, which do not affect
+    readiness.
+    """
+    details = details or {}
+
+    async def health():
+        try:
+            mongo = await database.health()
+        except (asyncio.TimeoutError, PyMongoError):
+            raise HTTPException(status_code=503, detail="Database unavailable")
+        return {"status": "ok", "mongo": mongo, **{name: detail() for name, detail in details.items()}}
+
+    app.add_api_route("/health", health, methods=["GET"])
@@ -0,0 +1,271 @@
+"""
+Lightweight metrics with Prometheus text exposition.
+
+Covers per-route latency and in-flight requests (ASGI middleware), MongoDB
+command timings (pymongo command monitoring) and outbound HTTP calls.
+Updates are a dict lookup and a few additions under an uncontended lock,
+cheap enough to leave on under full load.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from pymongo import monitoring
+from starlette.routing import Match
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        # Copied under the lock: driver threads add label sets while a scrape renders
+        with self._lock:
+            values = list(self._values.items())
+        lines = self.header()
+        for labels, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (non-cumulative) ..., +Inf], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def render(self) -> List[str]:
+        # Copied under the lock, so each label set's buckets and sum are consistent
+        with self._lock:
+            values = [(labels, (list(counts), list(total))) for labels, (counts, total) in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total) in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+def _cache_lines(caches: Dict[str, object]) -> Iterable[str]:
+    """Exposition lines for TTLCache counters, read at scrape time"""
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    for stat, metric_type in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"),
+                              ("expirations", "counter"), ("coalesced", "counter"), ("size", "gauge")):
+        name = f"cache_{stat}" + ("_total" if metric_type == "counter" else "")
+        yield f"# TYPE {name} {metric_type}"
+        for cache_name, values in stats.items():
+            yield f'{name}{{cache="{_escape(cache_name)}"}} {values[stat]}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._caches: Dict[str, object] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[str]]):
+        """Register a callable producing exposition lines at scrape time"""
+        self._collectors.append(collect)
+
+    def register_cache(self, name: str, cache):
+        """Expose the hit, miss and eviction counters of a TTLCache"""
+        self._caches[name] = cache
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        if self._caches:
+            lines.extend(_cache_lines(self._caches))
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_request_duration = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+http_requests_in_flight = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests being processed by route", ("method", "route")
+)
+mongo_command_duration = REGISTRY.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("command", "collection", "outcome")
+)
+outbound_request_duration = REGISTRY.histogram(
+    "outbound_request_duration_seconds", "Latency of calls to other services", ("target", "outcome")
+)
+
+
+# Scope key caching the route template, shared by the metrics, admission and profiling middlewares
+_ROUTE_KEY = "shared.route"
+
+
+def _route_of(scope) -> str:
+    """Route template for the request, to keep label cardinality bounded; resolved once per request"""
+    route_path = scope.get(_ROUTE_KEY)
+    if route_path is None:
+        route_path = "unmatched"
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                route_path = route.path
+                break
+        scope[_ROUTE_KEY] = route_path
+    return route_path
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency and in-flight requests per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = _route_of(scope)
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(time.perf_counter() - start, method, route, status)
+            http_requests_in_flight.dec(method, route)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times MongoDB commands by command name and collection"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            target = event.command.get("collection", "")
+        self._collections[self._key(event)] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop(self._key(event), "")
+        mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name, collection, outcome)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+def install_metrics(app: FastAPI, database):
+    """
+    Install request metrics on `app`, MongoDB command monitoring on `database`
+    (effective from its next connect_db) and serve everything at /metrics.
+    """
+    app.add_middleware(MetricsMiddleware)
+    database.client_options.setdefault("event_listeners", []).append(MongoCommandListener())
+
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
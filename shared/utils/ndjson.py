@@ -0,0 +1,229 @@
+"""
+Streaming NDJSON export and import of whole collections.
+
+Documents are written as MongoDB Extended JSON (bson.json_util, relaxed mode)
+so ObjectIds and dates round-trip. Export walks a server-side cursor in `_id`
+order, so an interrupted export resumes with `after` = the last exported
+`_id`. Import keeps `_id`s, so re-importing a partly imported file only
+reports the already present documents as duplicates. Memory use is bounded
+by the batch size and the number of chunks in flight, not the dataset size.
+A collection partitioned over several databases is exported as one stream
+merged in `_id` order, and imported by routing each document to its partition.
+"""
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Optional, Sequence
+
+from bson import ObjectId, json_util
+from bson.errors import BSONError, InvalidId
+from pymongo.errors import BulkWriteError
+
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+# Write errors reported in an import summary, beyond which only the counts grow
+MAX_REPORTED_ERRORS = 20
+
+# Longest accepted import line: a 16 MiB BSON document with room for its Extended JSON form
+MAX_LINE_BYTES = 32 * 1024 * 1024
+
+
+class LineTooLong(ValueError):
+    """An NDJSON line longer than the accepted maximum"""
+
+
+def export_query(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = None,
+    date_field: str = "created_at",
+    **equals
+) -> dict:
+    """Filter for an export: [since, until) on `date_field`, `_id` > `after` and exact matches"""
+    query = {field: value for field, value in equals.items() if value is not None}
+    if since or until:
+        query[date_field] = {}
+        if since:
+            query[date_field]["$gte"] = since
+        if until:
+            query[date_field]["$lt"] = until
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except (InvalidId, TypeError):
+            raise ValueError(f"Invalid resume id: {after}")
+    return query
+
+
+async def _merge_by_id(cursors: Sequence[Any]) -> AsyncIterator[dict]:
+    """Merge cursors sorted by `_id` into one sorted stream, holding one document per cursor"""
+    iterators = [aiter(cursor) for cursor in cursors]
+    heads = []
+    for index, iterator in enumerate(iterators):
+        document = await anext(iterator, None)
+        if document is not None:
+            heads.append((document["_id"], index, document))
+    heapq.heapify(heads)
+    while heads:
+        _, index, document = heads[0]
+        yield document
+        following = await anext(iterators[index], None)
+        if following is None:
+            heapq.heappop(heads)
+        else:
+            heapq.heapreplace(heads, (following["_id"], index, following))
+
+
+async def export_documents(collection, query: dict, batch_size: int) -> AsyncIterator[bytes]:
+    """
+    Yield the matching documents as NDJSON, one cursor batch per chunk.
+    `collection` may be a list of the partitions of a collection.
+    """
+    collections = collection if isinstance(collection, (list, tuple)) else [collection]
+    cursors = [item.find(query).sort("_id", 1).batch_size(batch_size) for item in collections]
+    lines = []
+    async for document in (cursors[0] if len(cursors) == 1 else _merge_by_id(cursors)):
+        lines.append(json_util.dumps(document, json_options=JSON_OPTIONS))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line: int = MAX_LINE_BYTES) -> AsyncIterator[bytes]:
+    """
+    Split a byte stream into lines, whatever the chunk boundaries.
+    Raises LineTooLong as soon as a line exceeds `max_line` bytes, so a body
+    without newlines is never held in memory whole.
+    """
+    buffer = bytearray()
+    lines = 0
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            if buffer:
+                buffer += chunk[start:end]
+                line = bytes(buffer)
+                buffer.clear()
+            else:
+                line = chunk[start:end]
+            lines += 1
+            if len(line) > max_line:
+                raise LineTooLong(f"line {lines} is longer than {max_line} bytes")
+            yield line
+            start = end + 1
+        buffer += chunk[start:]
+        if len(buffer) > max_line:
+            raise LineTooLong(f"line {lines + 1} is longer than {max_line} bytes")
+    if buffer:
+        yield bytes(buffer)
+
+
+class ImportSummary:
+    def __init__(self):
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.invalid_lines = 0
+        self.errors = []
+
+    def add_error(self, message: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "invalid_lines": self.invalid_lines,
+            "errors": self.errors,
+        }
+
+
+async def import_documents(
+    collection,
+    lines: AsyncIterable[bytes],
+    chunk_size: int,
+    concurrency: int,
+    route: Optional[Callable[[dict], Awaitable[int]]] = None
+) -> ImportSummary:
+    """
+    Insert NDJSON documents in chunks of `chunk_size` with unordered insert_many,
+    at most `concurrency` chunks in flight. Bad lines and write errors are
+    counted and do not stop the import.
+    With `route`, `collection` is a list of partitions and `await route(document)`
+    the index of a document's partition (ValueError for an unroutable one).
+    """
+    summary = ImportSummary()
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    collections = collection if route else [collection]
+
+    async def write(target, documents):
+        try:
+            result = await target.insert_many(documents, ordered=False)
+            summary.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            summary.inserted += e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == 11000:
+                    summary.duplicates += 1
+                else:
+                    summary.failed += 1
+                    summary.add_error(error.get("errmsg", "Write error"))
+        except Exception as e:
+            summary.failed += len(documents)
+            summary.add_error(str(e))
+        finally:
+            semaphore.release()
+
+    async def flush(target, documents):
+        # Waiting for a free slot here is what keeps memory bounded
+        await semaphore.acquire()
+        task = asyncio.ensure_future(write(target, documents))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    chunks = [[] for _ in collections]
+    line_number = 0
+    try:
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                document = json_util.loads(line, json_options=JSON_OPTIONS)
+            except (ValueError, BSONError) as e:
+                summary.invalid_lines += 1
+                summary.add_error(f"line {line_number}: {e}")
+                continue
+            if not isinstance(document, dict):
+                summary.invalid_lines += 1
+                summary.add_error(f"line {line_number}: not a JSON object")
+                continue
+            index = 0
+            if route:
+                try:
+                    index = await route(document)
+                except ValueError as e:
+                    summary.invalid_lines += 1
+                    summary.add_error(f"line {line_number}: {e}")
+                    continue
+            chunks[index].append(document)
+            if len(chunks[index]) >= chunk_size:
+                await flush(collections[index], chunks[index])
+                chunks[index] = []
+        for target, chunk in zip(collections, chunks):
+            if chunk:
+                await flush(target, chunk)
+    finally:
+        # Also when reading the input fails, so no write is left running
+        if tasks:
+            await asyncio.gather(*tasks)
+    return summary
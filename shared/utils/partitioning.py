@@ -0,0 +1,164 @@
+"""
+Partitioning of a service's data across several MongoDB databases by owner.
+
+Each owner (a user_id) lives in exactly one partition. Its home partition is
+a jump consistent hash of the owner id, so growing from N to N + 1
+partitions moves only about 1/(N + 1) of the owners. A routing table in the
+first partition pins owners elsewhere, e.g. while their data is being moved.
+"""
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from shared.utils.base_database import BaseDatabase
+from shared.utils.cache import TTLCache
+
+ROUTES = "partition_routes"
+
+# Route states: a pinned owner is read and written in its pinned partition;
+# a moving owner is still read there but its writes are refused until the move is done
+ACTIVE = "active"
+MOVING = "moving"
+
+
+def jump_hash(key: str, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach) of `key` into [0, buckets)"""
+    state = int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        state = (state * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((state >> 33) + 1)))
+    return bucket
+
+
+def _database_in(url: str) -> str:
+    """Database name in the path of a Mongo URL, or an empty string"""
+    rest = url.split("://", 1)[-1].split("?", 1)[0]
+    return rest.split("/", 1)[1] if "/" in rest else ""
+
+
+def parse_partitions(spec: str, default_url: str, default_database: str) -> List[Tuple[str, str]]:
+    """
+    (url, database) of each partition from a ";" separated list of Mongo URLs.
+    The database is the URL path, else `default_database`. An empty spec is
+    the single partition (`default_url`, `default_database`).
+    """
+    urls = [url.strip() for url in spec.split(";") if url.strip()]
+    if not urls:
+        return [(default_url, default_database)]
+    partitions = [(url, _database_in(url) or default_database) for url in urls]
+    if len(set(partitions)) != len(partitions):
+        raise ValueError("Partitions must be distinct databases")
+    return partitions
+
+
+class OwnerMoving(Exception):
+    """Writes of an owner are refused while its data is being moved"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+
+class PartitionedDatabase:
+    """
+    Several BaseDatabases, each with its own client, holding disjoint sets of owners.
+    All reads and writes of one owner go through the partition `for_owner` returns.
+    With a single partition there are no routing lookups at all.
+    """
+
+    def __init__(self, partitions: Sequence[BaseDatabase], routing_ttl: float = 2.0, routing_cache_size: int = 100000):
+        if not partitions:
+            raise ValueError("At least one partition is required")
+        self.partitions = list(partitions)
+        # Extra client options for every partition, e.g. the event_listeners of install_metrics
+        self.client_options: Dict[str, Any] = {}
+        # Routes are cached per process: a routing change takes up to `routing_ttl` to be seen everywhere
+        self.routes = TTLCache(max_size=routing_cache_size, ttl=routing_ttl)
+
+    @property
+    def client_factory(self):
+        return self.partitions[0].client_factory
+
+    @client_factory.setter
+    def client_factory(self, factory):
+        for partition in self.partitions:
+            partition.client_factory = factory
+
+    @property
+    def directory(self) -> BaseDatabase:
+        """The partition holding the routing table"""
+        return self.partitions[0]
+
+    def home(self, owner_id: str) -> int:
+        """Index of the partition an owner belongs in when it is not pinned"""
+        return jump_hash(owner_id, len(self.partitions))
+
+    async def load_route(self, owner_id: str) -> Optional[dict]:
+        """Routing table entry of an owner, read from the primary"""
+        return await self.directory.find_one(ROUTES, {"_id": owner_id})
+
+    async def route(self, owner_id: str) -> Optional[dict]:
+        """Cached routing table entry of an owner; None when it lives in its home partition"""
+        if len(self.partitions) == 1:
+            return None
+        return await self.routes.get_or_load(owner_id, lambda: self.load_route(owner_id))
+
+    async def partition_of(self, owner_id: str) -> int:
+        """Index of the partition an owner is currently read from"""
+        route = await self.route(owner_id)
+        return self.home(owner_id) if route is None else route["partition"]
+
+    async def for_owner(self, owner_id: str, write: bool = False) -> BaseDatabase:
+        """The partition holding `owner_id`; raises OwnerMoving for a write during a move"""
+        route = await self.route(owner_id)
+        if route is None:
+            return self.partitions[self.home(owner_id)]
+        if write and route.get("state") == MOVING:
+            raise OwnerMoving(self.routes.ttl)
+        return self.partitions[route["partition"]]
+
+    async def set_route(self, owner_id: str, partition: int, state: str = ACTIVE):
+        """Pin an owner to a partition"""
+        if not 0 <= partition < len(self.partitions):
+            raise ValueError(f"No partition {partition}")
+        routes = await self.directory.collection(ROUTES)
+        await routes.replace_one({"_id": owner_id}, {"partition": partition, "state": state}, upsert=True)
+        self.routes.invalidate(owner_id)
+
+    async def clear_route(self, owner_id: str):
+        """Send an owner back to its home partition"""
+        routes = await self.directory.collection(ROUTES)
+        await routes.delete_one({"_id": owner_id})
+        self.routes.invalidate(owner_id)
+
+    async def connect_db(self):
+        """Connect every partition"""
+        for partition in self.partitions:
+            for name, value in self.client_options.items():
+                if name == "event_listeners":
+                    listeners = partition.client_options.setdefault("event_listeners", [])
+                    listeners.extend(listener for listener in value if listener not in listeners)
+                else:
+                    partition.client_options[name] = value
+        await asyncio.gather(*(partition.connect_db() for partition in self.partitions))
+
+    async def close_db(self):
+        for partition in self.partitions:
+            await partition.close_db()
+
+    async def ensure_indexes(self):
+        for partition in self.partitions:
+            await partition.ensure_indexes()
+
+    async def health(self) -> Dict[str, Any]:
+        """Health of the single partition, or of each partition"""
+        if len(self.partitions) == 1:
+            return await self.partitions[0].health()
+        results = await asyncio.gather(*(partition.health() for partition in self.partitions))
+        return {
+            "partitions": [
+                {"database": partition.database_name, **result}
+                for partition, result in zip(self.partitions, results)
+            ]
+        }
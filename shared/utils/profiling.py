@@ -0,0 +1,318 @@
+"""
+Opt-in request profiling and event-loop blocking detection.
+
+A fraction of requests (PROFILE_SAMPLE_RATE), and any request carrying the
+admin key in `X-Profile-Key`, is profiled by a sampling thread that reads the
+event loop thread's stack every few milliseconds while that request's task is
+running. Profiles are collapsed stacks ("frame;frame;frame count"), which
+flamegraph.pl, speedscope and inferno read directly; they are kept in memory
+for the admin endpoints and optionally written to PROFILE_DIR.
+
+Independently, a monitor task measures event-loop lag and a watchdog thread
+records the stack of any synchronous section that holds the loop longer than
+BLOCKING_THRESHOLD_MS (an inline bcrypt call, a large response being built...).
+
+With profiling off the middleware is not installed at all; the lag monitor
+wakes up a few times per second.
+"""
+import asyncio
+import hmac
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from shared.utils.admin import require_admin
+from shared.utils.metrics import REGISTRY, _route_of
+
+PROFILE_HEADER = "X-Profile-Key"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Deepest stack kept per sample; deeper frames are cut at the root end
+MAX_STACK_DEPTH = 128
+
+profiles_captured = REGISTRY.counter("profiles_captured_total", "Requests profiled", ("reason",))
+loop_lag = REGISTRY.histogram(
+    "event_loop_lag_seconds", "Delay of the event loop in waking up a sleeping task",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+loop_blocked = REGISTRY.counter("event_loop_blocked_total", "Sections that held the event loop past the threshold")
+
+
+def collapse(frame) -> str:
+    """A stack as one collapsed-stack line, root first: "file.py:function;..." """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def render_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class Profile:
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, route: str, reason: str):
+        self.id = f"{os.getpid()}-{next(self._ids)}"
+        self.method = method
+        self.route = route
+        self.reason = reason
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.status: Optional[int] = None
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "route": self.route,
+            "reason": self.reason,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "samples": sum(self.stacks.values()),
+        }
+
+
+class Blocking:
+    """A section that held the event loop, with the stacks seen while it did"""
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.duration_ms = 0.0
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        stack = self.stacks.most_common(1)[0][0] if self.stacks else ""
+        return {
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            # The innermost frames are the interesting ones
+            "stack": stack.split(";")[-8:],
+        }
+
+
+class Profiler:
+    """
+    Owns the sampling and watchdog threads and the profiles kept for the admin endpoints.
+    `start` and `stop` are called from the application lifespan.
+    """
+
+    def __init__(self, sample_rate: float, interval: float, directory: str, keep: int,
+                 lag_interval: float, blocking_threshold: float):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory
+        self.profiles: Deque[Profile] = deque(maxlen=keep)
+        self.blocking: Deque[Blocking] = deque(maxlen=keep)
+        self.lag_interval = lag_interval
+        self.blocking_threshold = blocking_threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        # Task -> profile of the requests being profiled; written by the loop, read by the sampler
+        self._active: Dict[asyncio.Task, Profile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._heartbeat = 0.0
+        self._monitor: Optional[asyncio.Task] = None
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopping.clear()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self._threads = [threading.Thread(target=self._sample, name="profiler", daemon=True)]
+        if self.lag_interval > 0:
+            self._heartbeat = time.monotonic()
+            self._monitor = asyncio.ensure_future(self._watch_lag())
+            if self.blocking_threshold > 0:
+                self._threads.append(threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    # Request profiles
+
+    def begin(self, profile: Profile):
+        with self._lock:
+            self._active[asyncio.current_task()] = profile
+        self._wake.set()
+
+    def end(self, profile: Profile):
+        with self._lock:
+            self._active.pop(asyncio.current_task(), None)
+            if not self._active:
+                self._wake.clear()
+        profiles_captured.inc(profile.reason)
+        self.profiles.append(profile)
+        if self.directory:
+            self._loop.run_in_executor(None, self._write, profile)
+
+    def find(self, profile_id: str) -> Optional[Profile]:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _write(self, profile: Profile):
+        route = re.sub(r"[^A-Za-z0-9]+", "_", profile.route).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(profile.started_at))}-{profile.method}-{route}-{profile.id}.folded"
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write(render_collapsed(profile.stacks))
+
+    def _sample(self):
+        """Sampler thread: while requests are profiled, attribute loop stacks to the running request"""
+        while not self._stopping.is_set():
+            self._wake.wait()
+            while self._active and not self._stopping.is_set():
+                time.sleep(self.interval)
+                task = asyncio.current_task(self._loop)
+                frame = sys._current_frames().get(self._loop_thread)
+                with self._lock:
+                    # Only while the request is still active, so finished profiles never change
+                    profile = self._active.get(task)
+                    if profile is not None and frame is not None:
+                        profile.stacks[collapse(frame)] += 1
+
+    # Event loop lag and blocking
+
+    async def _watch_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            loop_lag.observe(max(0.0, loop.time() - start - self.lag_interval))
+
+    def _watchdog(self):
+        """Watchdog thread: sample the loop's stack while it misses its heartbeat by more than the threshold"""
+        current: Optional[Blocking] = None
+        check = min(self.blocking_threshold / 2, 0.05)
+        while not self._stopping.wait(check):
+            overdue = time.monotonic() - self._heartbeat - self.lag_interval
+            if overdue > self.blocking_threshold:
+                if current is None:
+                    current = Blocking(time.time() - overdue)
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    current.stacks[collapse(frame)] += 1
+                current.duration_ms = overdue * 1000
+            elif current is not None:
+                loop_blocked.inc()
+                self.blocking.append(current)
+                current = None
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling sampled requests and requests with a valid `X-Profile-Key`"""
+
+    def __init__(self, app, profiler: Profiler, debug_key: Optional[str]):
+        self.app = app
+        self.profiler = profiler
+        self.debug_key = debug_key.encode() if debug_key else None
+        self._header = PROFILE_HEADER.lower().encode()
+
+    def _reason(self, scope) -> Optional[str]:
+        if self.debug_key:
+            for name, value in scope.get("headers", ()):
+                if name == self._header:
+                    if hmac.compare_digest(value, self.debug_key):
+                        return "header"
+                    break
+        if self.profiler.sample_rate and random.random() < self.profiler.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        reason = self._reason(scope)
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["method"], _route_of(scope), reason)
+        profile_id = profile.id.encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER.lower().encode(), profile_id)]
+            await send(message)
+
+        start = time.perf_counter()
+        self.profiler.begin(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            self.profiler.end(profile)
+
+
+def install_profiling(app: FastAPI, settings) -> Profiler:
+    """
+    Install request profiling on `app` from a service's Settings and serve the
+    captured profiles at /admin/profiles. Start and stop the returned Profiler
+    in the lifespan.
+    """
+    profiler = Profiler(
+        sample_rate=settings.profile_sample_rate,
+        interval=settings.profile_interval_ms / 1000,
+        directory=settings.profile_dir,
+        keep=settings.profile_keep,
+        lag_interval=settings.loop_lag_interval_ms / 1000,
+        blocking_threshold=settings.blocking_threshold_ms / 1000,
+    )
+    if settings.profile_sample_rate > 0 or settings.admin_api_key:
+        app.add_middleware(ProfilingMiddleware, profiler=profiler, debug_key=settings.admin_api_key)
+
+    admin = [Depends(require_admin(settings.admin_api_key))]
+
+    async def list_profiles():
+        return {"profiles": [profile.summary() for profile in reversed(profiler.profiles)]}
+
+    async def get_profile(profile_id: str):
+        profile = profiler.find(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return PlainTextResponse(render_collapsed(profile.stacks))
+
+    async def list_blocking():
+        return {"blocking": [blocking.summary() for blocking in reversed(profiler.blocking)]}
+
+    async def blocking_stacks():
+        stacks = Counter()
+        for blocking in profiler.blocking:
+            stacks.update(blocking.stacks)
+        return PlainTextResponse(render_collapsed(stacks))
+
+    # The fixed paths first, so they are not taken for a profile id
+    app.add_api_route("/admin/profiles", list_profiles, methods=["GET"], dependencies=admin, include_in_schema=False)
+    app.add_api_route("/admin/profiles/blocking", list_blocking, methods=["GET"], dependencies=admin, include_in_schema=False)
+    app.add_api_route("/admin/profiles/blocking.folded", blocking_stacks, methods=["GET"], dependencies=admin, include_in_schema=False)
+    app.add_api_route("/admin/profiles/{profile_id}", get_profile, methods=["GET"], dependencies=admin, include_in_schema=False)
+    return profiler
@@ -0,0 +1,175 @@
+"""
+Building blocks for calls to other services: request deadlines, a circuit
+breaker with half-open probing and a retry budget.
+"""
+import time
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+from fastapi import FastAPI
+
+from shared.utils.metrics import _escape
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# time.monotonic() by which the current incoming request must be answered
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left for the current request, or None outside a request"""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware giving each request a deadline: `default_timeout` seconds,
+    or less when the caller sends its own remaining budget in `X-Request-Timeout` (ms).
+    """
+
+    def __init__(self, app, default_timeout: float):
+        self.app = app
+        self.default_timeout = default_timeout
+        self._header = DEADLINE_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timeout = self.default_timeout
+        for name, value in scope.get("headers", ()):
+            if name == self._header:
+                try:
+                    timeout = min(timeout, float(value) / 1000)
+                except ValueError:
+                    pass
+                break
+        token = request_deadline.set(time.monotonic() + timeout)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+
+def install_deadlines(app: FastAPI, default_timeout: float):
+    """Give every request on `app` a deadline; install after admission control so it wraps it"""
+    app.add_middleware(DeadlineMiddleware, default_timeout=default_timeout)
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. Then up to `half_open_calls` probes are let through:
+    a success closes the circuit, a failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejections = 0
+        self.opened = 0
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpen unless a call may go through now. Returns whether the
+        call took a half-open probe slot, to be given back with `release_probe`
+        if the call ends without recording an outcome.
+        """
+        if self.state == self.OPEN:
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout:
+                self.rejections += 1
+                raise CircuitOpen(self.reset_timeout - waited)
+            self.state = self.HALF_OPEN
+            self.probes = 0
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                self.rejections += 1
+                raise CircuitOpen(self.reset_timeout)
+            self.probes += 1
+            return True
+        return False
+
+    def release_probe(self):
+        """Give back the probe slot of a call that ended without success or failure (cancelled...)"""
+        if self.state == self.HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record_success(self):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejections": self.rejections,
+            "opened": self.opened,
+        }
+
+    def metric_lines(self) -> Iterable[str]:
+        """Exposition lines for REGISTRY.collector"""
+        name = _escape(self.name)
+        yield "# TYPE circuit_breaker_state gauge"
+        for state, value in ((self.CLOSED, 0), (self.HALF_OPEN, 1), (self.OPEN, 2)):
+            if self.state == state:
+                yield f'circuit_breaker_state{{target="{name}"}} {value}'
+        for stat in ("successes", "failures", "rejections", "opened"):
+            yield f"# TYPE circuit_breaker_{stat}_total counter"
+            yield f'circuit_breaker_{stat}_total{{target="{name}"}} {getattr(self, stat)}'
+
+
+class RetryBudget:
+    """
+    Allows retries up to `ratio` of the calls made, so retries cannot multiply
+    load on a struggling dependency. Every call deposits `ratio` tokens (up to
+    `max_tokens`), every retry spends one.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_call(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_retry(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"tokens": round(self.tokens, 2), "retries": self.retries, "exhausted": self.exhausted}
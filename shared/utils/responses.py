@@ -1,10 +1,22 @@
 """
 Centralized response handling for consistent API responses
 """
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Tuple, Type
+
+from bson import ObjectId
 from fastapi import HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
-from typing import Any
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the standard library
+    orjson = None
 
 
 class APIResponse:
@@ -31,6 +43,63 @@ class APIResponse:
         )
 
 
+def _default(value: Any) -> Any:
+    """Convert the non-JSON types found in Mongo documents"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize Mongo documents straight to JSON bytes, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+_model_fields: Dict[Type[BaseModel], Tuple[Tuple[str, Any], ...]] = {}
+
+
+def _fields_of(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    if model not in _model_fields:
+        _model_fields[model] = tuple(
+            (name, None if field.default is PydanticUndefined else field.default)
+            for name, field in model.model_fields.items()
+        )
+    return _model_fields[model]
+
+
+def serialize_document(document: dict, model: Type[BaseModel]) -> dict:
+    """
+    Shape a Mongo document like `model` without validating it.
+    `_id` becomes `id`, fields the model does not declare are dropped
+    (e.g. hashed_password), and missing fields take the model default.
+    Nested values are passed through as stored.
+    """
+    result = {}
+    for name, default in _fields_of(model):
+        if name == "id" and "_id" in document:
+            result["id"] = str(document["_id"])
+        else:
+            result[name] = document.get(name, default)
+    return result
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with `dumps`. Routes keep their `response_model` for the
+    OpenAPI schema and return this with `serialize_document` output, which skips
+    FastAPI's second validation pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Handle validation errors"""
     errors = []
@@ -49,10 +118,13 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions"""
-    return APIResponse.error(
+    response = APIResponse.error(
         message=exc.detail,
         status_code=exc.status_code
     )
+    if exc.headers:
+        response.headers.update(exc.headers)
+    return response
 
 
 async def general_exception_handler(request: Request, exc: Exception):
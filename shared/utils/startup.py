@@ -0,0 +1,53 @@
+"""
+Startup profile and warm-up of the services.
+
+Import this module before anything else in a service's main module: the
+clock starts here, so the "imports" phase covers FastAPI, Motor, passlib,
+jose, httpx and the shared models. It deliberately imports nothing heavy.
+"""
+import inspect
+import time
+from typing import Any, Callable, Dict, Iterable
+
+IMPORT_STARTED = time.perf_counter()
+
+
+class StartupProfile:
+    """Wall time of consecutive startup phases, each measured from the end of the previous one"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.phases: Dict[str, float] = {}
+        self._last = IMPORT_STARTED
+
+    def mark(self, phase: str):
+        """End `phase` now"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def report(self) -> str:
+        phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.phases.items())
+        return f"{self.service} ready in {self.total:.3f}s ({phases})"
+
+    def metric_lines(self) -> Iterable[str]:
+        """Exposition lines for REGISTRY.collector"""
+        yield "# TYPE startup_phase_seconds gauge"
+        for phase, seconds in self.phases.items():
+            yield f'startup_phase_seconds{{phase="{phase}"}} {seconds:.6f}'
+
+
+async def warm_up(app, *steps: Callable[[], Any]):
+    """
+    Do the work otherwise left to the first requests: generate the OpenAPI
+    schema (JSON schemas of every model) and run each priming step, sync or async.
+    """
+    app.openapi()
+    for step in steps:
+        result = step()
+        if inspect.isawaitable(result):
+            await result
@@ -0,0 +1,164 @@
+"""
+Export and import orders or users as NDJSON, directly against MongoDB.
+
+    python transfer.py export orders -o orders.ndjson --since 2024-01-01 --status delivered
+    python transfer.py export orders -o orders.ndjson --resume
+    python transfer.py import orders -i orders.ndjson --database order_service_staging
+    ORDER_PARTITIONS="mongodb://a:27017/orders_0;mongodb://b:27017/orders_1" python transfer.py import orders -i orders.ndjson
+
+Exports stream from a server-side cursor in `_id` order; `--resume` reads
+the last `_id` already in the output file and appends after it. Imports keep
+`_id`s, so an interrupted import can simply be run again. Orders follow the
+Order Service's ORDER_PARTITIONS: exports merge every partition in `_id`
+order and imports write each order to its user's partition.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+from bson import json_util
+
+from shared.utils.base_database import BaseDatabase
+from shared.utils.ndjson import JSON_OPTIONS, export_documents, export_query, import_documents
+from shared.utils.partitioning import PartitionedDatabase, parse_partitions
+
+COLLECTIONS = {
+    # collection: default database
+    "orders": "order_service_db",
+    "users": "user_service_db",
+}
+
+
+def drop_partial_line(path: str):
+    """Cut an interrupted write back to the last complete line"""
+    with open(path, "rb+") as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            step = min(64 * 1024, position)
+            f.seek(position - step)
+            end = f.read(step).rfind(b"\n")
+            if end >= 0:
+                f.truncate(position - step + end + 1)
+                return
+            position -= step
+        f.truncate(0)
+
+
+def last_exported_id(path: str):
+    """`_id` of the last line of an export file, or None"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 64 * 1024))
+        lines = f.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return str(json_util.loads(line, json_options=JSON_OPTIONS)["_id"])
+        except (ValueError, KeyError):
+            continue
+    return None
+
+
+async def read_lines(path: str):
+    with open(path, "rb") as f:
+        for line in f:
+            yield line
+
+
+async def export(args, collection):
+    after = args.after
+    mode = "ab" if args.resume else "wb"
+    if args.resume and os.path.exists(args.output):
+        drop_partial_line(args.output)
+        after = last_exported_id(args.output) or after
+        if after:
+            print(f"Resuming after _id {after}")
+    equals = {"status": args.status} if args.collection == "orders" else {}
+    query = export_query(args.since, args.until, after, **equals)
+
+    count = 0
+    with open(args.output, mode) as f:
+        async for chunk in export_documents(collection, query, args.batch_size):
+            f.write(chunk)
+            count += chunk.count(b"\n")
+    return f"{count} {args.collection} exported to {args.output}"
+
+
+async def import_(args, collection, route=None):
+    summary = await import_documents(collection, read_lines(args.input), args.batch_size, args.concurrency, route=route)
+    for error in summary.errors:
+        print(f"  {error}")
+    result = summary.as_dict()
+    result.pop("errors")
+    return f"{args.collection} imported from {args.input}: {result}"
+
+
+def partitioned(args) -> PartitionedDatabase:
+    """The databases holding the collection: the Order Service's partitions for orders"""
+    database = args.database or COLLECTIONS[args.collection]
+    if args.collection != "orders" or args.database:
+        return PartitionedDatabase([BaseDatabase(args.mongodb_url, database)])
+    return PartitionedDatabase([
+        BaseDatabase(url, name) for url, name in parse_partitions(args.partitions, args.mongodb_url, database)
+    ])
+
+
+async def main(args):
+    db = partitioned(args)
+    start = time.perf_counter()
+    try:
+        await db.connect_db()
+        collections = [await partition.collection(args.collection) for partition in db.partitions]
+        if args.command == "export":
+            message = await export(args, collections)
+        else:
+            async def route(order: dict) -> int:
+                if not isinstance(order.get("user_id"), str):
+                    raise ValueError("order without a user_id")
+                return await db.partition_of(order["user_id"])
+
+            if len(collections) == 1:
+                message = await import_(args, collections[0])
+            else:
+                message = await import_(args, collections, route)
+    finally:
+        await db.close_db()
+    print(f"{message} in {time.perf_counter() - start:.1f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("collection", choices=sorted(COLLECTIONS))
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", help="defaults to the owning service's database")
+    parser.add_argument("--partitions", default=os.getenv("ORDER_PARTITIONS", ""),
+                        help="order partitions, as ORDER_PARTITIONS (default: that variable)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="cursor batch / insert chunk size")
+    parser.add_argument("-o", "--output", help="export file")
+    parser.add_argument("-i", "--input", help="import file")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="created at or after (ISO date)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="created before (ISO date)")
+    parser.add_argument("--status", help="order status (orders only)")
+    parser.add_argument("--after", help="export documents after this _id")
+    parser.add_argument("--resume", action="store_true", help="append to the output after its last _id")
+    parser.add_argument("--concurrency", type=int, default=4, help="insert chunks in flight")
+    args = parser.parse_args()
+    if args.command == "export" and not args.output:
+        parser.error("export requires --output")
+    if args.command == "import" and not args.input:
+        parser.error("import requires --input")
+    if args.database and args.collection == "orders" and len(parse_partitions(args.partitions, "", "")) > 1:
+        parser.error("--database names a single database, but the orders are partitioned")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
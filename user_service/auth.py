@@ -2,27 +2,34 @@
 Authentication and authorization utilities.
 Handles password hashing, JWT token generation, and verification.
 """
-from passlib.context import CryptContext
+from typing import Optional, Tuple
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+from bson import ObjectId
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from config import settings
 from shared.models.base import TokenData
+from shared.utils.base_database import LOOKUP
+from shared.utils.cache import TTLCache
 from database import db
+from passwords import hash_password, verify_and_update_password
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+user_cache = TTLCache(max_size=settings.user_cache_size, ttl=settings.user_cache_ttl)
 
 
-def get_password_hash(password: str) -> str:
-    """Hash a password using bcrypt"""
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """Hash a password using bcrypt, off the event loop"""
+    return await hash_password(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password against its hash, off the event loop.
+    Returns the verification result and a replacement hash if the stored cost is outdated.
+    """
+    return await verify_and_update_password(plain_password, hashed_password)
 
 
 def create_access_token(data: dict):
@@ -35,6 +42,84 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
 
 
+def warm_up_jwt():
+    """Issue and decode a token once, so the first login does not load the JOSE backend"""
+    jwt.decode(
+        create_access_token({"sub": "warm-up"}),
+        settings.jwt_secret_key,
+        algorithms=[settings.jwt_algorithm]
+    )
+
+
+def profile_claims(user: dict) -> dict:
+    """Extra token claims that let the auth dependency rebuild the user without a query"""
+    if not settings.user_cache_from_claims:
+        return {}
+    return {"full_name": user["full_name"], "created_at": user["created_at"].isoformat()}
+
+
+def user_from_claims(payload: dict) -> Optional[dict]:
+    """Rebuild a user document from the token claims, if profile claims are present"""
+    if not settings.user_cache_from_claims:
+        return None
+    if not all(payload.get(claim) for claim in ("sub", "user_id", "full_name", "created_at")):
+        return None
+    return {
+        "_id": ObjectId(payload["user_id"]),
+        "email": payload["sub"],
+        "full_name": payload["full_name"],
+        "created_at": datetime.fromisoformat(payload["created_at"]),
+    }
+
+
+def cache_user(user: dict):
+    """Store a user document under both its email and its id"""
+    user_cache.set(("email", user["email"]), user)
+    user_cache.set(("id", str(user["_id"])), user)
+
+
+def invalidate_user(email: Optional[str] = None, user_id: Optional[str] = None):
+    """Drop a user from the cache. Call after any write to a user document."""
+    if email:
+        user_cache.invalidate(("email", email))
+    if user_id:
+        user_cache.invalidate(("id", user_id))
+
+
+def _user_ttl(user: Optional[dict]) -> Optional[float]:
+    """Unknown users are not cached"""
+    return None if user else 0
+
+
+async def get_user_by_email(email: str, claims: Optional[dict] = None) -> Optional[dict]:
+    """
+    Read-through lookup of a user by email.
+    On a miss the user is rebuilt from `claims` when possible, otherwise read from MongoDB.
+    """
+    async def load():
+        user = user_from_claims(claims) if claims else None
+        if user is None:
+            user = await db.find_one("users", {"email": email}, LOOKUP)
+        if user:
+            cache_user(user)
+        return user
+
+    user = await user_cache.get_or_load(("email", email), load, ttl=_user_ttl)
+    return dict(user) if user else None
+
+
+async def get_user_by_id(user_id: str) -> Optional[dict]:
+    """Read-through lookup of a user by id"""
+    async def load():
+        user = await db.find_one("users", {"_id": ObjectId(user_id)}, LOOKUP)
+        if user:
+            cache_user(user)
+        return user
+
+    user = await user_cache.get_or_load(("id", user_id), load, ttl=_user_ttl)
+    return dict(user) if user else None
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
     Middleware dependency for authenticating requests.
@@ -57,8 +142,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-    database = await db.get_database()
-    user = await database.users.find_one({"email": token_data.email})
+    user = await get_user_by_email(token_data.email, claims=payload)
 
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
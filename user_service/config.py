@@ -3,14 +3,70 @@ Configuration management for User Service.
 """
 import os
 
+from shared.utils.base_database import derived_key, read_mongo_settings
+
 
 class Settings:
     def __init__(self):
         self.mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
         self.database_name = os.getenv("DATABASE_NAME", "user_service_db")
+        self.service_port = int(os.getenv("SERVICE_PORT", "8000"))
+        # Process model when started through main.py
+        self.workers = int(os.getenv("WORKERS", "1"))
+        self.reload = os.getenv("RELOAD", "false").lower() == "true"
+        self.graceful_shutdown_timeout = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "20"))
+        # Time budget of each request; callers can lower it with X-Request-Timeout (ms)
+        self.request_timeout = float(os.getenv("REQUEST_TIMEOUT", "10"))
+        # Build schemas and prime the auth backends in the lifespan, before the service reports ready
+        self.startup_warmup = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+        # Key required in the X-Admin-Key header of admin endpoints; unset disables them
+        self.admin_api_key = os.getenv("ADMIN_API_KEY")
+
+        # Admin NDJSON export/import: cursor batch size, import chunk size and chunks in flight
+        self.export_batch_size = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+        self.import_chunk_size = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+        self.import_concurrency = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+
+        # MongoDB pool, compression, concerns, warm-up and read preferences (MONGO_*)
+        read_mongo_settings(self)
+
+        # Admission control: per-route concurrency caps ("METHOD /route=limit,..." overrides,
+        # 0 = unlimited), bounded wait queue and queue-time budget, per-client token buckets (0 = off)
+        self.admission_max_concurrency = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))
+        self.admission_route_limits = os.getenv("ADMISSION_ROUTE_LIMITS", "")
+        self.admission_max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+        self.admission_queue_timeout_ms = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "200"))
+        self.admission_client_rate = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+        self.admission_client_burst = float(os.getenv("ADMISSION_CLIENT_BURST", "20"))
+        # Request profiling: a sampled fraction of requests (0 = off) and requests whose X-Profile-Key
+        # holds ADMIN_API_KEY; collapsed stacks kept in memory and also written to PROFILE_DIR if set
+        self.profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.profile_interval_ms = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+        self.profile_dir = os.getenv("PROFILE_DIR", "")
+        self.profile_keep = int(os.getenv("PROFILE_KEEP", "50"))
+        # Event loop lag measurement (0 = off) and the stall recorded as a blocking section
+        self.loop_lag_interval_ms = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+        self.blocking_threshold_ms = float(os.getenv("BLOCKING_THRESHOLD_MS", "100"))
+
         self.jwt_secret_key = os.getenv("JWT_SECRET_KEY", "sEcReT")
         self.jwt_algorithm = os.getenv("JWT_ALGORITHM", "HS256")
+        # Signs X-Causal-Token values; unset derives a separate key from JWT_SECRET_KEY
+        self.causal_token_key = os.getenv("CAUSAL_TOKEN_KEY") or derived_key(self.jwt_secret_key, "causal-token")
         self.access_token_expire_minutes = 30
+        # Largest number of ids accepted by the batch user lookup
+        self.user_batch_max_ids = int(os.getenv("USER_BATCH_MAX_IDS", "500"))
+
+        # Password hashing: bcrypt cost and the worker pool it runs on ("thread" or "process")
+        self.bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.password_hash_executor = os.getenv("PASSWORD_HASH_EXECUTOR", "thread").lower()
+        self.password_hash_workers = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 4)))
+        self.password_hash_max_queue = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "100"))
+
+        # Read-through cache of user documents used by the auth dependency
+        self.user_cache_size = int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self.user_cache_ttl = float(os.getenv("USER_CACHE_TTL", "60"))
+        # Embed profile claims in tokens and build cached users from them on a miss
+        self.user_cache_from_claims = os.getenv("USER_CACHE_FROM_CLAIMS", "false").lower() == "true"
 
 
 settings = Settings()
@@ -1,9 +1,28 @@
+from pymongo import ASCENDING, IndexModel
+
 from config import settings
-from shared.utils.base_database import BaseDatabase
+from shared.utils.base_database import LIST, LOOKUP, BaseDatabase, client_options_from
 
 
 class Database(BaseDatabase):
+    indexes = {
+        "users": [
+            IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        ],
+    }
+
     def __init__(self):
-        super().__init__(settings.mongodb_url, settings.database_name)
+        super().__init__(
+            settings.mongodb_url,
+            settings.database_name,
+            client_options=client_options_from(settings),
+            warmup_connections=settings.mongo_warmup_connections,
+            read_preferences={
+                LOOKUP: settings.mongo_read_preference_lookup,
+                LIST: settings.mongo_read_preference_list,
+            },
+            max_staleness=settings.mongo_max_staleness_seconds,
+            causal_token_key=settings.causal_token_key
+        )
 
-db = Database()
\ No newline at end of file
+db = Database()
@@ -1,32 +1,59 @@
 """
 FastAPI application for User Service
 """
+# First, so that the startup profile times every other import
+from shared.utils.startup import StartupProfile, warm_up
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import Field
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
+from typing import Dict, List, Optional
 import uvicorn
 
-from shared.models.user import UserCreate, UserResponse
+from shared.models.user import UserBatchRequest, UserBatchResponse, UserCreate, UserResponse
 from shared.models.base import Token
 
 from shared.utils.responses import (
     APIResponse,
+    FastJSONResponse,
+    serialize_document,
     validation_exception_handler,
     http_exception_handler,
     general_exception_handler
 )
+from shared.utils.admin import require_admin
+from shared.utils.admission import install_admission
+from shared.utils.base_database import LIST, LOOKUP, PRIMARY
+from shared.utils.health import install_health
+from shared.utils.ndjson import LineTooLong, export_documents, export_query, import_documents, iter_lines
+from shared.utils.metrics import REGISTRY, install_metrics
+from shared.utils.profiling import install_profiling
+from shared.utils.resilience import install_deadlines
 from database import db
+from config import settings
+from passwords import hasher
 from auth import (
     get_password_hash,
     create_access_token,
     get_current_user,
-    verify_password
+    get_user_by_id,
+    invalidate_user,
+    profile_claims,
+    user_cache,
+    verify_password,
+    warm_up_jwt
 )
 
+startup = StartupProfile("User Service")
+startup.mark("imports")
+
 
 @asynccontextmanager
 async def lifespan(app_: FastAPI):
@@ -36,12 +63,23 @@ async def lifespan(app_: FastAPI):
     """
     # Startup
     print("Starting up...")
+    startup.mark("app")
     await db.connect_db()
+    await db.ensure_indexes()
+    startup.mark("mongo")
+    hasher.start()
+    if settings.startup_warmup:
+        await warm_up(app_, warm_up_models, warm_up_jwt, hasher.warm_up)
+        startup.mark("warm_up")
+    profiler.start()
+    print(startup.report())
 
     yield  # Server is running and handling requests
 
     # Shutdown
     print("Shutting down...")
+    await profiler.stop()
+    hasher.shutdown()
     await db.close_db()
 
 app = FastAPI(
@@ -51,6 +89,12 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Last added runs first: CORS headers reach every response, shed ones included; metrics see
+# shed requests, admission control sees the deadline and only admitted requests are profiled
+profiler = install_profiling(app, settings)
+install_admission(app, settings)
+install_deadlines(app, settings.request_timeout)
+install_metrics(app, db)
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -58,29 +102,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Readable by browser clients, e.g. Retry-After on shed requests
+    expose_headers=["Retry-After", "X-Profile-Id"],
 )
 
+REGISTRY.register_cache("user", user_cache)
+REGISTRY.collector(startup.metric_lines)
+
 # Add exception handlers
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 app.add_exception_handler(HTTPException, http_exception_handler)
 app.add_exception_handler(Exception, general_exception_handler)
 
 
+def warm_up_models():
+    """Validate and serialize a sample user once, ahead of the first request"""
+    user = UserCreate.model_validate({"email": "warm-up@example.com", "full_name": "Warm Up", "password": "-"})
+    document = {**user.model_dump(exclude={"password"}), "_id": ObjectId(), "created_at": datetime.now()}
+    FastJSONResponse(serialize_document(document, UserResponse))
+    UserResponse(**document, id=str(document["_id"])).model_dump(mode="json")
+
+
 @app.post("/users/createUser", response_model=UserResponse, status_code=201)
 async def create_user(user: UserCreate):
     """
     Create a new user
     """
     database = await db.get_database()
-    if await database.users.find_one({"email": user.email}):
+    # Cheap early answer for known emails before paying for bcrypt; the index still decides races
+    if await database.users.find_one({"email": user.email}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Email already registered")
-
     user_dict = user.model_dump()
-    user_dict["hashed_password"] = get_password_hash(user_dict.pop("password"))
+    user_dict["hashed_password"] = await get_password_hash(user_dict.pop("password"))
     user_dict["created_at"] = datetime.now()
     user_dict["updated_at"] = user_dict["created_at"]
 
-    result = await database.users.insert_one(user_dict)
+    # The unique index on users.email rejects duplicates atomically
+    try:
+        result = await database.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     user_dict["id"] = str(result.inserted_id)
 
     return UserResponse(**user_dict)
@@ -94,14 +155,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     database = await db.get_database()
     user = await database.users.find_one({"email": form_data.username})
 
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_password(form_data.password, user["hashed_password"])
+
+    if not valid:
         raise HTTPException(
             status_code=401,
             detail="Incorrect email or password"
         )
 
+    # Transparently upgrade hashes created with an outdated bcrypt cost
+    if new_hash:
+        await database.users.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}})
+        invalidate_user(email=user["email"], user_id=str(user["_id"]))
+
     access_token = create_access_token(
-        data={"sub": form_data.username, "user_id": str(user["_id"])}
+        data={"sub": form_data.username, "user_id": str(user["_id"]), **profile_claims(user)}
     )
     return Token(access_token=access_token)
 
@@ -111,8 +181,7 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """
     Get information about the currently authenticated user.
     """
-    current_user["id"] = str(current_user["_id"])
-    return UserResponse(**current_user)
+    return FastJSONResponse(serialize_document(current_user, UserResponse))
 
 
 @app.get("/users/{user_id}", response_model=UserResponse)
@@ -123,15 +192,116 @@ async def get_user(
     """
     Get user information by ID (requires authentication).
     """
-    database = await db.get_database()
-    user = await database.users.find_one({"_id": ObjectId(user_id)})
+    user = await get_user_by_id(user_id)
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user["id"] = str(user.pop("_id"))
-    return UserResponse(**user)
+    return FastJSONResponse(serialize_document(user, UserResponse))
+
+
+class BoundedUserBatchRequest(UserBatchRequest):
+    # Checked while the body is validated, before the ids are looked at
+    ids: List[str] = Field(max_length=settings.user_batch_max_ids)
+
+
+@app.post("/users/batch", response_model=UserBatchResponse)
+async def get_users_batch(
+        batch: BoundedUserBatchRequest,
+        current_user: dict = Depends(get_current_user)
+):
+    """
+    Get several users by ID with a single query (requires authentication).
+    Unknown and malformed IDs are reported per ID instead of failing the request.
+    At most USER_BATCH_MAX_IDS ids are accepted (422 beyond that).
+    """
+    # Ids differing only in hex case are the same ObjectId: each is answered under its own spelling
+    requested: Dict[ObjectId, List[str]] = {}
+    invalid = []
+    for user_id in dict.fromkeys(batch.ids):
+        try:
+            requested.setdefault(ObjectId(user_id), []).append(user_id)
+        except (InvalidId, TypeError):
+            invalid.append(user_id)
+
+    users = {}
+    projection = {field: 1 for field in UserResponse.model_fields if field != "id"}
+    missing = list(requested)
+    for operation in (LOOKUP, PRIMARY):
+        if not missing or (operation == PRIMARY and db.reads_from_primary(LOOKUP)):
+            break
+        # Ids a lagging secondary did not return are looked up again on the primary
+        collection = await db.collection("users", operation)
+        async for user in collection.find({"_id": {"$in": missing}}, projection):
+            found = serialize_document(user, UserResponse)
+            for user_id in requested[user["_id"]]:
+                users[user_id] = found
+        missing = [object_id for object_id in missing if requested[object_id][0] not in users]
+
+    not_found = [user_id for user_ids in requested.values() for user_id in user_ids if user_id not in users]
+    return FastJSONResponse({"users": users, "not_found": not_found, "invalid": invalid})
+
+
+@app.get(
+    "/admin/users/export",
+    dependencies=[Depends(require_admin(settings.admin_api_key))]
+)
+async def export_users(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = None,
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=10000)
+):
+    """
+    Stream all users, password hashes included, as NDJSON (MongoDB Extended JSON)
+    in `_id` order, optionally created in [since, until).
+    Resume an interrupted export with `after` = the last exported `_id`.
+    """
+    try:
+        query = export_query(since, until, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    collection = await db.collection("users", LIST)
+    return StreamingResponse(
+        export_documents(collection, query, batch_size),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post(
+    "/admin/users/import",
+    dependencies=[Depends(require_admin(settings.admin_api_key))]
+)
+async def import_users(
+    request: Request,
+    chunk_size: int = Query(settings.import_chunk_size, ge=1, le=10000),
+    concurrency: int = Query(settings.import_concurrency, ge=1, le=32)
+):
+    """
+    Bulk import users from an NDJSON request body, read and written in chunks.
+    Users whose `_id` or email already exists are counted as duplicates.
+    """
+    database = await db.get_database()
+    try:
+        summary = await import_documents(database.users, iter_lines(request.stream()), chunk_size, concurrency)
+    except LineTooLong as e:
+        # Lines before it are imported; the file can be fixed and sent again
+        raise HTTPException(status_code=413, detail=str(e))
+    return APIResponse.success(message="Users imported", data=summary.as_dict())
+
+
+install_health(app, db)
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # loop/http "auto" use uvloop and httptools when they are installed
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=settings.service_port,
+        reload=settings.reload,
+        workers=settings.workers,
+        loop="auto",
+        http="auto",
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout
+    )
@@ -0,0 +1,108 @@
+"""
+Password hashing on a bounded worker pool.
+bcrypt is CPU bound, so running it inline would block the event loop.
+"""
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+from fastapi import HTTPException
+from config import settings
+
+# Hashes whose cost differs from bcrypt_rounds are flagged for re-hashing
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _load_backend() -> str:
+    """Load and self-test the bcrypt backend, which passlib otherwise does on the first hash"""
+    return pwd_context.handler("bcrypt").get_backend()
+
+
+class PasswordHasher:
+    """
+    Runs hashing on a thread or process pool with at most `workers` calls in flight
+    and at most `max_queue` callers waiting. `workers=0` hashes inline on the event loop.
+    """
+
+    def __init__(self, workers: int, max_queue: int, executor: str = "thread"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+
+    def start(self):
+        if self.workers <= 0:
+            return
+        if self.executor_kind == "process":
+            # Every process loads the backend before taking any call, whichever calls it takes
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_load_backend)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._semaphore = asyncio.Semaphore(self.workers)
+
+    async def warm_up(self):
+        """
+        Load the bcrypt backend in every worker. A process pool spawns its
+        processes on demand: submitting `workers` calls at once starts all of
+        them, and each runs the `_load_backend` initializer before its first call.
+        """
+        if self._executor is None:
+            _load_backend()
+            return
+        loop = asyncio.get_running_loop()
+        calls = self.workers if self.executor_kind == "process" else 1
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _load_backend) for _ in range(calls)))
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        if self.pending >= self.workers + self.max_queue:
+            raise HTTPException(status_code=503, detail="Too many password operations in progress")
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+
+hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+    executor=settings.password_hash_executor,
+)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password using bcrypt"""
+    return await hasher.run(_hash, password)
+
+
+async def verify_and_update_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password against its hash.
+    Also returns a new hash when the stored one uses an outdated cost factor.
+    """
+    return await hasher.run(_verify_and_update, password, hashed_password)